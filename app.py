@@ -1,23 +1,65 @@
 import os
-from flask import Flask, render_template, redirect, url_for, request, flash, abort
+from flask import Flask, render_template, redirect, url_for, request, flash, abort, jsonify, Response, stream_with_context, send_file, g, session, has_request_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import DBAPIError
+from flask_sqlalchemy.session import Session as FlaskSession
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_bcrypt import Bcrypt
 from datetime import datetime, timedelta
 import calendar as cal_module
 import json
-import statistics
-import random
 import math
+import base64
+import csv
+import io
+import hashlib
+import click
+from functools import lru_cache, wraps
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import uuid
+import multiprocessing
+import threading
+import time
+import sqlite3
+from werkzeug.middleware.proxy_fix import ProxyFix
+from ratelimit import TokenBucketLimiter
+from stats_engine import TradeFrame, FRAME_COLUMNS, make_stats_table, merge_confluences
+import montecarlo
+import equity
+import rolling
+import cache
+import instrumentation
+import migrations
+from instrumentation import span
 
-app = Flask(__name__)
+# --- CACHE HTTP ---
+# Pagine HTML: mai in cache. Static: un anno, con ?v=<mtime> nell'URL per invalidarle.
+# Le route che impostano il proprio Cache-Control (API con ETag) non vengono toccate.
+# L'anno vale solo per l'endpoint static: gli altri send_file (export dei job) restano privati.
+STATIC_MAX_AGE = 31536000
 
-# --- ANTI-CACHE ---
+class JournalFlask(Flask):
+    def get_send_file_max_age(self, filename):
+        if request.endpoint == 'static':
+            return STATIC_MAX_AGE
+        return super().get_send_file_max_age(filename)
+
+app = JournalFlask(__name__)
 app.config['TEMPLATES_AUTO_RELOAD'] = True
-app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
+
+@app.url_defaults
+def static_version(endpoint, values):
+    if endpoint == 'static' and 'filename' in values:
+        path = os.path.join(app.static_folder, values['filename'])
+        if os.path.isfile(path): values['v'] = int(os.stat(path).st_mtime)
 
 @app.after_request
 def add_header(response):
+    if request.endpoint == 'static' or 'Cache-Control' in response.headers:
+        return response
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, post-check=0, pre-check=0, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '-1'
@@ -33,24 +75,132 @@ if database_url and database_url.startswith("postgres://"):
 
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url or 'sqlite:///trading_journal.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool per worker (solo PostgreSQL: SQLite usa i default di Flask-SQLAlchemy) e pre-ping
+app.config['DB_POOL_SIZE'] = int(os.environ.get('DB_POOL_SIZE', 5))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+# Replica in sola lettura (opzionale) per le route di lettura pesanti, con timeout per statement
+# (ms, solo PostgreSQL). Dopo una scrittura l'utente legge dal primario per READ_YOUR_WRITES_SECONDS
+read_url = os.environ.get('DATABASE_READ_URL')
+if read_url and read_url.startswith("postgres://"):
+    read_url = read_url.replace("postgres://", "postgresql://", 1)
+app.config['DATABASE_READ_URL'] = read_url
+app.config['READ_STATEMENT_TIMEOUT_MS'] = int(os.environ.get('READ_STATEMENT_TIMEOUT_MS', 30000))
+app.config['READ_YOUR_WRITES_SECONDS'] = float(os.environ.get('READ_YOUR_WRITES_SECONDS', 10))
+# 'offset' (page=N) oppure 'keyset' (cursore opaco, costo costante per pagina)
+app.config['DASHBOARD_PAGINATION'] = os.environ.get('DASHBOARD_PAGINATION', 'offset')
+# Profilo cProfile delle richieste più lente di N ms (disattivato se non impostato)
+app.config['PROFILE_SLOW_MS'] = float(os.environ['PROFILE_SLOW_MS']) if os.environ.get('PROFILE_SLOW_MS') else None
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+# Cache risultati: LRU locale sempre; CACHE_URL (redis://... o fake://) aggiunge il livello condiviso
+app.config['CACHE_URL'] = os.environ.get('CACHE_URL')
+app.config['CACHE_TTL'] = int(os.environ.get('CACHE_TTL', 300))
+# Job in background: processi del pool, cartella dei file prodotti, durata massima di un job.
+# Oltre STATS_ASYNC_MIN_TRADES trade /statistics mostra l'ultimo snapshot calcolato in background
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_DIR'] = os.path.abspath(os.environ.get('JOB_DIR', 'job_results'))
+app.config['JOB_TIMEOUT'] = int(os.environ.get('JOB_TIMEOUT', 3600))
+app.config['STATS_ASYNC_MIN_TRADES'] = int(os.environ.get('STATS_ASYNC_MIN_TRADES', 20000))
+# Password: costo bcrypt (gli hash con un costo diverso vengono rigenerati al login), thread
+# per gli hash e richieste in attesa oltre le quali si risponde 503. HASH_WORKERS + HASH_QUEUE
+# va tenuto sotto i --threads di gunicorn (Procfile: 8), così restano thread per le altre pagine
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+app.config['HASH_WORKERS'] = int(os.environ.get('HASH_WORKERS', 2))
+app.config['HASH_QUEUE'] = int(os.environ.get('HASH_QUEUE', 4))
+# Tentativi di login / registrazione: token bucket per IP e per username (0 = nessun limite)
+app.config['LOGIN_RATE_PER_MIN'] = float(os.environ.get('LOGIN_RATE_PER_MIN', 10))
+app.config['LOGIN_BURST'] = int(os.environ.get('LOGIN_BURST', 5))
+# Numero di proxy davanti all'app (es. 1 sul router della piattaforma): l'IP del client
+# viene da X-Forwarded-For solo per quei livelli. Sul deploy del Procfile (DYNO impostata)
+# il router c'è sempre: senza, tutti i client avrebbero l'IP del router e un solo bucket
+app.config['PROXY_COUNT'] = int(os.environ.get('PROXY_COUNT', 1 if 'DYNO' in os.environ else 0))
+if app.config['PROXY_COUNT']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_COUNT'], x_proto=app.config['PROXY_COUNT'])
+
+# --- DATABASE & REPLICA IN LETTURA ---
+def engine_options(url, statement_timeout_ms=None, read_only=False):
+    options = {'pool_pre_ping': True}
+    if url.startswith('postgresql'):
+        options.update(pool_size=app.config['DB_POOL_SIZE'], max_overflow=app.config['DB_MAX_OVERFLOW'],
+                       pool_recycle=app.config['DB_POOL_RECYCLE'])
+        pg = [f'-c statement_timeout={statement_timeout_ms}'] if statement_timeout_ms else []
+        if read_only: pg.append('-c default_transaction_read_only=on')
+        if pg: options['connect_args'] = {'options': ' '.join(pg)}
+    return options
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+if app.config['DATABASE_READ_URL']:
+    app.config['SQLALCHEMY_BINDS'] = {'replica': dict(url=app.config['DATABASE_READ_URL'], **engine_options(
+        app.config['DATABASE_READ_URL'], app.config['READ_STATEMENT_TIMEOUT_MS'], read_only=True))}
 
-db = SQLAlchemy(app)
+# Le SELECT delle route marcate @read_replica vanno alla replica; tutto il resto al primario.
+# Dalla prima scrittura in poi la sessione (cioè la richiesta) legge solo dal primario
+class RoutingSession(FlaskSession):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and 'replica' in self._db.engines:
+            if isinstance(clause, db.Select) and clause._for_update_arg is None and not self._flushing:
+                if not self.info.get('primary') and has_request_context() and g.get('read_replica'):
+                    return self._db.engines['replica']
+            else:
+                self.info['primary'] = True
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 bcrypt = Bcrypt(app)
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
+instrumentation.init_app(app)
+
+# SQLite come replica di prova: connessioni in sola lettura anche a livello di driver
+with app.app_context():
+    if 'replica' in db.engines and db.engines['replica'].dialect.name == 'sqlite':
+        db.event.listen(db.engines['replica'], 'connect', lambda conn, record: conn.execute('PRAGMA query_only = ON'))
+
+# Read-your-writes: dopo un commit nella richiesta, per qualche secondo l'utente non legge dalla replica
+@db.event.listens_for(RoutingSession, 'after_commit')
+def stick_to_primary(db_session):
+    if has_request_context() and 'replica' in db.engines and db_session.info.get('primary'):
+        session['primary_until'] = time.time() + app.config['READ_YOUR_WRITES_SECONDS']
+
+def read_replica(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = request.method in ('GET', 'HEAD') and session.get('primary_until', 0) < time.time()
+        return view(*args, **kwargs)
+    return wrapper
+
+# Prove locali con due file SQLite: copia il primario nella replica (backup online di sqlite3)
+@app.cli.command('sync-replica')
+def sync_replica_command():
+    replica = db.engines.get('replica')
+    if replica is None:
+        raise click.ClickException('DATABASE_READ_URL non impostato.')
+    if db.engine.dialect.name != 'sqlite' or replica.dialect.name != 'sqlite':
+        raise click.ClickException('Solo per SQLite: con PostgreSQL la replica è gestita dal database.')
+    source = db.engine.raw_connection()
+    try:
+        with sqlite3.connect(replica.url.database) as target:
+            source.driver_connection.backup(target)
+    finally:
+        source.close()
+    replica.dispose()
+    click.echo(f'Replica aggiornata: {replica.url.database}')
 
 # --- MODELS ---
 class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
-    password = db.Column(db.String(150), nullable=False)
+    # caricati di default solo id, username e role (il principal di ogni richiesta):
+    # hash e testi delle impostazioni arrivano al primo accesso, un gruppo per volta
+    password = db.deferred(db.Column(db.String(150), nullable=False))
     role = db.Column(db.String(20), default='student') 
     trades = db.relationship('JournalEntry', backref='author', lazy=True)
-    pros_settings = db.Column(db.Text, default="Trendline,Supporto,Rottura Struttura") 
-    cons_settings = db.Column(db.Text, default="Contro Trend,News in arrivo")
-    trading_rules = db.Column(db.Text, default="1. Attendi chiusura candela\n2. Non tradare durante news rosse")
-    risk_rules = db.Column(db.Text, default="1. Max 1% rischio per trade\n2. Max 3 stop loss al giorno")
-    custom_pairs = db.Column(db.Text, default="") 
+    pros_settings = db.deferred(db.Column(db.Text, default="Trendline,Supporto,Rottura Struttura"), group='setup') 
+    cons_settings = db.deferred(db.Column(db.Text, default="Contro Trend,News in arrivo"), group='setup')
+    trading_rules = db.deferred(db.Column(db.Text, default="1. Attendi chiusura candela\n2. Non tradare durante news rosse"), group='rules')
+    risk_rules = db.deferred(db.Column(db.Text, default="1. Max 1% rischio per trade\n2. Max 3 stop loss al giorno"), group='rules')
+    custom_pairs = db.deferred(db.Column(db.Text, default=""), group='setup') 
+    settings_rev = db.Column(db.Integer, default=0)   # +1 ad ogni salvataggio di settings: chiave della cache delle liste
 
 class JournalEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -79,10 +229,834 @@ class JournalEntry(db.Model):
     screen_post = db.Column(db.String(200)) 
     notes = db.Column(db.Text)
     emotions = db.Column(db.String(50))
+    tags = db.relationship('TradeTag', backref='trade', lazy=True, cascade='all, delete-orphan')
+    __table_args__ = (
+        db.Index('ix_journal_entry_user_date', 'user_id', 'date'),
+        db.Index('ix_journal_entry_user_pair_date', 'user_id', 'pair', 'date'),
+        db.Index('ix_journal_entry_user_outcome', 'user_id', 'outcome'),
+    )
+
+# Tag normalizzati (una riga per timeframe / alignment / pro / contro / screenshot)
+class TradeTag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    trade_id = db.Column(db.Integer, db.ForeignKey('journal_entry.id', ondelete='CASCADE'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    value = db.Column(db.Text, nullable=False)
+    __table_args__ = (db.Index('ix_trade_tag_user_kind_value', 'user_id', 'kind', 'value'),)
+
+TAG_SOURCES = {'timeframe': 'timeframe', 'alignment': 'alignment', 'pro': 'selected_pros',
+               'con': 'selected_cons', 'screen': 'screen_pre'}
+
+# Aggregati incrementali per utente (bucket: all, dir:Long, wd:0, wk:1, m:2026-01, yw:2026-05)
+class TradeStat(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    bucket = db.Column(db.String(30), nullable=False)
+    n = db.Column(db.Integer, default=0)             # tutti i trade
+    pl = db.Column(db.Float, default=0)              # somma result_percent (tutti)
+    active = db.Column(db.Integer, default=0)        # Target / Stop Loss / Breakeven
+    wins = db.Column(db.Integer, default=0)
+    losses = db.Column(db.Integer, default=0)
+    active_pl = db.Column(db.Float, default=0)
+    active_pl_sq = db.Column(db.Float, default=0)
+    win_pl = db.Column(db.Float, default=0)
+    loss_pl = db.Column(db.Float, default=0)
+    win_rr_n = db.Column(db.Integer, default=0)
+    win_rr_sum = db.Column(db.Float, default=0)
+    rev = db.Column(db.Integer, default=0)           # +1 ad ogni scrittura: versione per le cache
+    __table_args__ = (db.UniqueConstraint('user_id', 'bucket'),)
+
+TRADE_STAT_FIELDS = ('n', 'pl', 'active', 'wins', 'losses', 'active_pl', 'active_pl_sq',
+                     'win_pl', 'loss_pl', 'win_rr_n', 'win_rr_sum')
+ACTIVE_OUTCOMES = ['Target', 'Stop Loss', 'Breakeven']
+
+# Job in background (statistics / montecarlo / export): stato, avanzamento e risultato
+class AnalyticsJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)            # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False)
+    scope = db.Column(db.String(20))                           # cache_scope dei dati
+    version = db.Column(db.String(64))                         # ETag dei dati alla richiesta
+    params = db.Column(db.Text, default='{}')                  # JSON con chiavi ordinate
+    status = db.Column(db.String(10), default='queued')        # queued / running / done / failed
+    progress = db.Column(db.Integer, default=0)
+    result = db.Column(db.Text)                                # JSON; export: metadati del file
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    __table_args__ = (db.Index('ix_analytics_job_kind_scope', 'kind', 'scope', 'created_at'),)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id))
+
+# --- PASSWORD & LIMITI LOGIN ---
+# bcrypt rilascia il GIL: gli hash girano in un pool di thread limitato, una raffica di login
+# non occupa più di HASH_WORKERS core e oltre HASH_QUEUE attese si risponde subito 503.
+# Serve un worker a thread (gunicorn gthread): con un worker sync la richiesta resta comunque
+# bloccata sull'hash e il limite non libera nulla
+hash_pool = ThreadPoolExecutor(max_workers=app.config['HASH_WORKERS'], thread_name_prefix='bcrypt')
+hash_slots = threading.BoundedSemaphore(app.config['HASH_WORKERS'] + app.config['HASH_QUEUE'])
+login_limiter = TokenBucketLimiter(app.config['LOGIN_RATE_PER_MIN'], app.config['LOGIN_BURST'])
+
+def run_hash(fn, *args):
+    if not hash_slots.acquire(blocking=False):
+        abort(503)
+    try:
+        return hash_pool.submit(fn, *args).result()
+    finally:
+        hash_slots.release()
+
+def hash_password(password):
+    return run_hash(bcrypt.generate_password_hash, password).decode('utf-8')
+
+def check_password(pw_hash, password):
+    return run_hash(bcrypt.check_password_hash, pw_hash, password)
+
+# $2b$<costo>$...: da rigenerare se il costo non è quello configurato
+def hash_needs_update(pw_hash):
+    parts = pw_hash.split('$')
+    return len(parts) < 4 or not parts[2].isdigit() or int(parts[2]) != app.config['BCRYPT_LOG_ROUNDS']
+
+# Limite prima di qualunque hash; ritorna None oppure la risposta 429 già pronta
+def login_rate_limited(template, username):
+    keys = [f"ip:{request.remote_addr}"]
+    if username: keys.append(f"user:{username.lower()}")
+    allowed, retry_after = login_limiter.hit(*keys)
+    if allowed:
+        return None
+    flash(f'Troppi tentativi, riprova tra {retry_after} secondi.', 'danger')
+    return render_template(template), 429, {'Retry-After': str(retry_after)}
+
+# --- CAMPI TRADE ---
+# Stesse regole di conversione per form, import CSV e CLI
+TRADE_TEXT_FIELDS = ('pair', 'time', 'direction', 'outcome', 'timeframe', 'alignment',
+                     'selected_pros', 'selected_cons', 'screen_pre', 'emotions', 'notes')
+TRADE_FLOAT_FIELDS = ('risk_percent', 'rr_final', 'pips_sl', 'pips_tp', 'result_percent')
+
+def form_trade_values(form):
+    raw = {f: form.get(f) for f in TRADE_TEXT_FIELDS + TRADE_FLOAT_FIELDS + ('date',)}
+    raw['timeframe'] = ",".join(form.getlist('timeframe_barrier'))
+    raw['alignment'] = ",".join(form.getlist('timeframe_align'))
+    raw['selected_pros'] = ",".join(form.getlist('pros'))
+    raw['selected_cons'] = ",".join(form.getlist('cons'))
+    raw['screen_pre'] = ",".join([l for l in [form.get('link1','').strip(), form.get('link2','').strip()] if l])
+    return raw
+
+def coerce_trade(raw):
+    values = {f: raw.get(f) for f in TRADE_TEXT_FIELDS}
+    values['date'] = datetime.strptime(raw.get('date'), '%Y-%m-%d')
+    for f in TRADE_FLOAT_FIELDS:
+        values[f] = float(raw.get(f) or 0)
+    return values
+
+# --- TAG ---
+def split_tags(raw):
+    return [v.strip() for v in raw.split(',') if v.strip()] if raw else []
+
+def trade_tag_values(trade):
+    return [(kind, v) for kind, col in TAG_SOURCES.items() for v in split_tags(getattr(trade, col))]
+
+# Le colonne CSV restano la fonte per i template; i tag vengono riscritti ad ogni salvataggio
+def set_trade_tags(trade):
+    trade.tags = [TradeTag(user_id=trade.user_id, kind=kind, value=v) for kind, v in trade_tag_values(trade)]
+
+def backfill_trade_tags(user_id=None, batch_size=5000):
+    q = TradeTag.query
+    if user_id is not None: q = q.filter_by(user_id=user_id)
+    q.delete(synchronize_session=False)
+    src = JournalEntry.query.with_entities(JournalEntry.id, JournalEntry.user_id, *[getattr(JournalEntry, c) for c in TAG_SOURCES.values()])
+    if user_id is not None: src = src.filter_by(user_id=user_id)
+    batch, written = [], 0
+    for row in src.yield_per(batch_size):
+        for kind, raw in zip(TAG_SOURCES, row[2:]):
+            batch.extend({'trade_id': row[0], 'user_id': row[1], 'kind': kind, 'value': v} for v in split_tags(raw))
+        if len(batch) >= batch_size:
+            db.session.execute(db.insert(TradeTag), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(TradeTag), batch)
+        written += len(batch)
+    db.session.commit()
+    return written
+
+# {valore: {'total', 'wins', 'pl'}} sui trade attivi, un solo GROUP BY su trade_tag
+def tag_stats(base_query, kind, row_type=None):
+    rows = (base_query.join(TradeTag, TradeTag.trade_id == JournalEntry.id)
+            .filter(TradeTag.kind == kind, JournalEntry.outcome.in_(ACTIVE_OUTCOMES))
+            .with_entities(TradeTag.value, db.func.count(TradeTag.id),
+                           db.func.sum(db.case((JournalEntry.outcome == 'Target', 1), else_=0)),
+                           db.func.sum(db.func.coalesce(JournalEntry.result_percent, 0)))
+            .group_by(TradeTag.value)
+            .order_by(db.func.min(JournalEntry.date), db.func.min(TradeTag.id)).all())
+    out = {}
+    for value, total, wins, pl in rows:
+        out[value] = {'total': total, 'wins': int(wins or 0), 'pl': float(pl or 0) or 0}
+        if row_type: out[value]['type'] = row_type
+    return out
+
+def tag_filter_clause(tag_filter, user_id=None):
+    kind, _, value = tag_filter.partition(':')
+    cond = {'kind': kind, 'value': value}
+    if user_id is not None: cond['user_id'] = user_id
+    return JournalEntry.tags.any(**cond)
+
+@app.cli.command('backfill-tags')
+@click.option('--user', 'username', default=None, help='Solo per questo utente.')
+def backfill_tags_command(username):
+    user_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if not user: raise click.ClickException(f'Utente "{username}" non trovato.')
+        user_id = user.id
+    click.echo(f'Tag scritti: {backfill_trade_tags(user_id)}.')
+
+# --- QUERY ---
+# [inizio, fine) del mese "YYYY-MM": confronto diretto sulla colonna, usa l'indice su date
+def month_range(month_str):
+    year, month = map(int, month_str.split('-'))
+    start = datetime(year, month, 1).date()
+    end = datetime(year + month // 12, month % 12 + 1, 1).date()
+    return start, end
+
+# Query dei trade con i filtri della dashboard (pair, outcome, mese, tag)
+def filtered_trades_query(user, args):
+    query = JournalEntry.query
+    user_id = None if user.role == 'admin' else user.id
+    if user_id is not None:
+        query = query.filter_by(user_id=user_id)
+    
+    pair_filter = args.get('pair_filter')
+    outcome_filter = args.get('outcome_filter')
+    date_filter = args.get('date_filter')
+    tag_filter = args.get('tag_filter')
+    if pair_filter: query = query.filter(JournalEntry.pair == pair_filter)
+    if outcome_filter: query = query.filter(JournalEntry.outcome == outcome_filter)
+    if tag_filter: query = query.filter(tag_filter_clause(tag_filter, user_id))
+    if date_filter:
+        start, end = month_range(date_filter)
+        query = query.filter(JournalEntry.date >= start, JournalEntry.date < end)
+    return query
+
+# --- PAGINAZIONE KEYSET ---
+# Cursore opaco: base64 di [direzione, data, id] dell'ultima/prima riga mostrata
+def encode_cursor(direction, trade):
+    raw = json.dumps([direction, trade.date.isoformat(), trade.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(token):
+    try:
+        direction, d, trade_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return direction, datetime.strptime(d[:10], '%Y-%m-%d').date(), int(trade_id)
+    except (ValueError, TypeError):
+        return None
+
+# Ordina su (date DESC, id DESC) e filtra sulla chiave invece di usare OFFSET
+class KeysetPage:
+    def __init__(self, query, cursor=None, per_page=15):
+        key = db.tuple_(JournalEntry.date, JournalEntry.id)
+        decoded = decode_cursor(cursor) if cursor else None
+        direction = decoded[0] if decoded else 'next'
+        if direction == 'prev':
+            query = query.filter(key > (decoded[1], decoded[2])).order_by(JournalEntry.date.asc(), JournalEntry.id.asc())
+        else:
+            if decoded: query = query.filter(key < (decoded[1], decoded[2]))
+            query = query.order_by(JournalEntry.date.desc(), JournalEntry.id.desc())
+        rows = query.limit(per_page + 1).all()
+        more = len(rows) > per_page
+        rows = rows[:per_page]
+        if direction == 'prev':
+            rows.reverse()
+            self.has_prev, self.has_next = more, True
+        else:
+            self.has_prev, self.has_next = decoded is not None, more
+        self.items = rows
+        self.next_cursor = encode_cursor('next', rows[-1]) if self.has_next and rows else None
+        self.prev_cursor = encode_cursor('prev', rows[0]) if self.has_prev and rows else None
+
+# --- AGGREGATI STATISTICHE ---
+def trade_stat_buckets(trade):
+    w_num = min((trade.date.day - 1) // 7 + 1, 5)
+    buckets = ['all', f"wd:{trade.date.weekday()}", f"wk:{w_num}",
+               f"m:{trade.date.strftime('%Y-%m')}", f"yw:{trade.date.strftime('%Y-%W')}"]
+    if trade.outcome in ACTIVE_OUTCOMES and trade.direction in ('Long', 'Short'):
+        buckets.append(f"dir:{trade.direction}")
+    return buckets
+
+def trade_stat_delta(trade):
+    res = trade.result_percent or 0
+    d = dict.fromkeys(TRADE_STAT_FIELDS, 0)
+    d['n'], d['pl'] = 1, res
+    if trade.outcome in ACTIVE_OUTCOMES:
+        d['active'], d['active_pl'], d['active_pl_sq'] = 1, res, res * res
+        if trade.outcome == 'Target':
+            d['wins'], d['win_pl'] = 1, res
+            if trade.rr_final is not None:
+                d['win_rr_n'], d['win_rr_sum'] = 1, trade.rr_final
+        elif trade.outcome == 'Stop Loss':
+            d['losses'], d['loss_pl'] = 1, res
+    return d
+
+# INSERT ... ON CONFLICT (user_id, bucket) DO UPDATE: atomico anche con due scritture concorrenti
+# sulla stessa riga nuova. Altri database: UPDATE e, se manca la riga, INSERT
+UPSERT_INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+# rows: [{user_id, bucket, campi}]; add=True somma i campi alla riga esistente (rev +1),
+# altrimenti li sostituisce. Una sola executemany per blocco
+def upsert_trade_stats(rows, add=True):
+    if not rows: return
+    t = TradeStat.__table__
+    insert = UPSERT_INSERTS.get(db.engine.dialect.name)
+    if insert is None:
+        for row in rows:
+            changes = {f: (t.c[f] + row[f] if add else row[f]) for f in TRADE_STAT_FIELDS}
+            if add: changes['rev'] = t.c.rev + 1
+            key = (t.c.user_id == row['user_id'], t.c.bucket == row['bucket'])
+            if not db.session.execute(t.update().where(*key).values(changes)).rowcount:
+                db.session.execute(t.insert().values(rev=1, **row))
+        return
+    stmt = insert(t)
+    changes = {f: (t.c[f] + stmt.excluded[f] if add else stmt.excluded[f]) for f in TRADE_STAT_FIELDS}
+    if add: changes['rev'] = t.c.rev + 1
+    db.session.execute(stmt.on_conflict_do_update(index_elements=[t.c.user_id, t.c.bucket], set_=changes),
+                       [dict(row, rev=1) for row in rows])
+
+# Applica {bucket: delta} agli aggregati di un utente
+def apply_trade_stat_deltas(user_id, deltas):
+    upsert_trade_stats([dict(delta, user_id=user_id, bucket=bucket) for bucket, delta in deltas.items()])
+
+# sign=+1 dopo insert/modifica, sign=-1 prima di delete/modifica. Non fa commit:
+# l'aggiornamento viaggia nella stessa transazione del trade.
+def update_trade_stats(trade, sign=1):
+    delta = {f: sign * v for f, v in trade_stat_delta(trade).items()}
+    apply_trade_stat_deltas(trade.user_id, {bucket: delta for bucket in trade_stat_buckets(trade)})
+
+# Le righe esistenti non vengono cancellate: azzerate con rev +1, così rev (chiave delle cache
+# e degli ETag) non torna mai su valori già usati
+def rebuild_trade_stats(user_id=None):
+    q = TradeStat.query
+    if user_id is not None: q = q.filter_by(user_id=user_id)
+    q.update(dict(dict.fromkeys(TRADE_STAT_FIELDS, 0), rev=TradeStat.rev + 1), synchronize_session=False)
+    acc = {}
+    trades = JournalEntry.query
+    if user_id is not None: trades = trades.filter_by(user_id=user_id)
+    for t in trades.yield_per(1000):
+        delta = trade_stat_delta(t)
+        for bucket in trade_stat_buckets(t):
+            row = acc.setdefault((t.user_id, bucket), dict.fromkeys(TRADE_STAT_FIELDS, 0))
+            for f, v in delta.items(): row[f] += v
+    upsert_trade_stats([dict(vals, user_id=uid, bucket=b) for (uid, b), vals in acc.items()], add=False)
+    db.session.commit()
+    return len(acc)
+
+# Ritorna {bucket: {campo: valore}}; senza user_id somma tutti gli utenti (vista admin)
+def load_trade_stats(user_id=None):
+    fields = TRADE_STAT_FIELDS + ('rev',)
+    cols = [db.func.sum(getattr(TradeStat, f)) for f in fields]
+    q = db.session.query(TradeStat.bucket, *cols)
+    if user_id is not None:
+        q = q.filter(TradeStat.user_id == user_id)
+    rows = q.group_by(TradeStat.bucket).all()
+    return {r[0]: clean_trade_stat(dict(zip(fields, [v or 0 for v in r[1:]]))) for r in rows}
+
+# Le somme float aggiornate con +delta / -delta non tornano esattamente a zero dopo le
+# cancellazioni (es. -2.8e-17): a zero se il conteggio è zero o se sono sotto STAT_EPSILON
+STAT_EPSILON = 1e-9
+STAT_SUM_COUNTS = {'pl': 'n', 'active_pl': 'active', 'active_pl_sq': 'active', 'win_pl': 'wins',
+                   'loss_pl': 'losses', 'win_rr_sum': 'win_rr_n'}
+
+def clean_trade_stat(row):
+    for f, count in STAT_SUM_COUNTS.items():
+        if not row[count] or abs(row[f]) < STAT_EPSILON:
+            row[f] = 0
+    return row
+
+# --- CALENDARIO ---
+# P/L e numero trade per giorno del mese: un solo GROUP BY date
+def month_day_stats(user_id, year, month):
+    start, end = month_range(f"{year}-{month}")
+    q = JournalEntry.query
+    if user_id is not None: q = q.filter_by(user_id=user_id)
+    rows = (q.filter(JournalEntry.date >= start, JournalEntry.date < end)
+            .with_entities(JournalEntry.date, db.func.sum(db.func.coalesce(JournalEntry.result_percent, 0)), db.func.count(JournalEntry.id))
+            .group_by(JournalEntry.date).all())
+    return {d.day: (float(pl or 0) or 0, n) for d, pl, n in rows}
+
+def build_calendar(day_stats, year, month):
+    cal_obj = cal_module.Calendar(firstweekday=6) 
+    month_days = cal_obj.monthdayscalendar(year, month)
+    calendar_data = []
+    for week in month_days:
+        week_stats = {'days': [], 'week_pl': 0, 'trade_count': 0}
+        for day in week:
+            if day == 0:
+                week_stats['days'].append(None)
+            else:
+                d_pl, d_count = day_stats.get(day, (0, 0))
+                d_pl = round(d_pl, 2)
+                week_stats['days'].append({'day': day, 'pl': d_pl, 'count': d_count})
+                week_stats['week_pl'] += d_pl
+                week_stats['trade_count'] += d_count
+        week_stats['week_pl'] = round(week_stats['week_pl'], 2)
+        calendar_data.append(week_stats)
+    return calendar_data
+
+# La versione (n, pl, rev del bucket mensile) cambia ad ogni scrittura nel mese,
+# quindi una modifica invalida la voce anche negli altri worker
+@lru_cache(maxsize=512)
+def cached_calendar(user_id, year, month, version):
+    return build_calendar(month_day_stats(user_id, year, month), year, month)
+
+def month_calendar(user_id, year, month, month_stat):
+    today = datetime.now()
+    if (year, month) >= (today.year, today.month):
+        return build_calendar(month_day_stats(user_id, year, month), year, month)
+    return cached_calendar(user_id, year, month, (month_stat['n'], round(month_stat['pl'], 6), month_stat['rev']))
+
+@app.cli.command('rebuild-stats')
+@click.option('--user', 'username', default=None, help='Ricostruisce solo per questo utente.')
+def rebuild_stats_command(username):
+    user_id = None
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if not user: raise click.ClickException(f'Utente "{username}" non trovato.')
+        user_id = user.id
+    click.echo(f'Aggregati ricostruiti: {rebuild_trade_stats(user_id)} righe.')
+
+# --- CACHE RISULTATI ---
+result_cache = cache.from_url(app.config['CACHE_URL'], ttl=app.config['CACHE_TTL'])
+
+# Scope: un utente ('u<id>') oppure la vista admin su tutti ('all')
+def cache_scope(user_id):
+    return 'all' if user_id is None else f'u{user_id}'
+
+# Dopo ogni scrittura di trade: via le voci dell'utente e della vista admin
+def invalidate_trade_cache(user_id):
+    result_cache.bump(cache_scope(user_id), cache_scope(None))
+
+# Liste da impostazioni utente (pros, cons, coppie custom in maiuscolo), in cache per utente:
+# le colonne di testo si leggono solo a cache vuota. La chiave contiene settings_rev, letto dal
+# database con il principal: ogni worker vede subito un salvataggio, anche senza CACHE_URL
+def settings_scope(user_id):
+    return f's{user_id}'
+
+def parse_setting_lists(pros_settings, cons_settings, custom_pairs):
+    pros = [p for p in (pros_settings.split(',') if pros_settings else []) if p]
+    cons = [c for c in (cons_settings.split(',') if cons_settings else []) if c]
+    pairs = [p.strip().upper() for p in (custom_pairs.split(',') if custom_pairs else []) if p.strip()]
+    return [pros, cons, pairs]
+
+def user_setting_lists(user):
+    return result_cache.get_or_set(settings_scope(user.id), f'lists:{user.settings_rev or 0}',
+                                   lambda: parse_setting_lists(user.pros_settings, user.cons_settings, user.custom_pairs))
+
+# --- IMPORT CSV ---
+# Intestazioni alternative (export broker MT4/MT5 e simili) -> colonne del journal
+IMPORT_ALIASES = {'symbol': 'pair', 'item': 'pair', 'type': 'direction', 'profit %': 'result_percent',
+                  'result': 'result_percent', 'rr': 'rr_final', 'risk': 'risk_percent'}
+DIRECTION_ALIASES = {'buy': 'Long', 'sell': 'Short', 'long': 'Long', 'short': 'Short'}
+# Lunghezze massime delle colonne String: su PostgreSQL un valore più lungo fa fallire il blocco
+IMPORT_MAX_LENGTHS = {c.name: c.type.length for c in JournalEntry.__table__.columns
+                      if isinstance(c.type, db.String) and c.type.length}
+
+def import_row_values(raw):
+    raw = {IMPORT_ALIASES.get(k, k): (v.strip() if isinstance(v, str) else v) for k, v in raw.items()}
+    if not raw.get('pair'): raise ValueError('pair mancante')
+    if not raw.get('date'): raise ValueError('date mancante')
+    raw['pair'] = raw['pair'].upper()
+    if raw.get('direction'): raw['direction'] = DIRECTION_ALIASES.get(raw['direction'].lower(), raw['direction'])
+    values = coerce_trade(raw)
+    for field, value in values.items():
+        limit = IMPORT_MAX_LENGTHS.get(field)
+        if limit and isinstance(value, str) and len(value) > limit:
+            raise ValueError(f'{field} troppo lungo (max {limit} caratteri)')
+    return values
+
+# Scrive un blocco di trade già validati: INSERT multiplo (Core, senza ORM) con RETURNING
+# degli id, tag e aggregati in blocco, una sola transazione per blocco
+def insert_trade_batch(user_id, rows):
+    for r in rows: r['user_id'] = user_id
+    t = JournalEntry.__table__
+    ids = db.session.execute(t.insert().returning(t.c.id, sort_by_parameter_order=True), rows).scalars().all()
+    tags, deltas = [], {}
+    for trade_id, r in zip(ids, rows):
+        trade = SimpleNamespace(**r)
+        tags.extend({'trade_id': trade_id, 'user_id': user_id, 'kind': kind, 'value': v} for kind, v in trade_tag_values(trade))
+        delta = trade_stat_delta(trade)
+        for bucket in trade_stat_buckets(trade):
+            acc = deltas.setdefault(bucket, dict.fromkeys(TRADE_STAT_FIELDS, 0))
+            for f, v in delta.items(): acc[f] += v
+    if tags: db.session.execute(TradeTag.__table__.insert(), tags)
+    apply_trade_stat_deltas(user_id, deltas)
+    db.session.commit()
+    invalidate_trade_cache(user_id)
+    return len(ids)
+
+# Blocco rifiutato dal database (valore non valido sfuggito ai controlli): si riprova riga per
+# riga, così solo le righe colpevoli finiscono in errors e le altre vengono importate
+def flush_import_batch(user_id, batch, errors):
+    try:
+        return insert_trade_batch(user_id, [values for _, values in batch])
+    except DBAPIError:
+        db.session.rollback()
+    imported = 0
+    for line_no, values in batch:
+        try:
+            imported += insert_trade_batch(user_id, [values])
+        except DBAPIError as e:
+            db.session.rollback()
+            errors.append((line_no, f'rifiutata dal database ({type(e.orig).__name__})'))
+    return imported
+
+# Legge il CSV riga per riga (nessun caricamento completo in memoria); le righe non valide
+# finiscono in errors (numero riga, messaggio) senza interrompere il blocco. Un file illeggibile
+# ferma la lettura ma i blocchi già scritti restano e vengono contati
+def import_trades_csv(stream, user_id, batch_size=1000):
+    reader = csv.DictReader(stream)
+    imported, errors, batch, line_no = 0, [], [], 1
+    try:
+        if reader.fieldnames:
+            reader.fieldnames = [(h or '').strip().lower() for h in reader.fieldnames]
+        for line_no, raw in enumerate(reader, start=2):
+            try:
+                batch.append((line_no, import_row_values(raw)))
+            except (ValueError, TypeError, AttributeError) as e:
+                errors.append((line_no, str(e)))
+                continue
+            if len(batch) >= batch_size:
+                imported += flush_import_batch(user_id, batch, errors)
+                batch = []
+    except (csv.Error, UnicodeDecodeError) as e:
+        errors.append((line_no + 1, f'lettura interrotta: {e}'))
+    if batch:
+        imported += flush_import_batch(user_id, batch, errors)
+    return imported, errors
+
+@app.cli.command('import-trades')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--user', 'username', required=True, help='Utente proprietario dei trade.')
+@click.option('--batch-size', default=5000, show_default=True)
+def import_trades_command(path, username, batch_size):
+    user = User.query.filter_by(username=username).first()
+    if not user: raise click.ClickException(f'Utente "{username}" non trovato.')
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        imported, errors = import_trades_csv(f, user.id, batch_size)
+    for line_no, msg in errors[:50]:
+        click.echo(f'riga {line_no}: {msg}', err=True)
+    click.echo(f'Importati {imported} trade, {len(errors)} righe scartate.')
+
+# --- EXPORT ---
+# Colonne esportate: tutte quelle del trade + username; le colonne a lista (quelle da cui
+# nascono i tag) diventano array nei formati JSON
+EXPORT_COLUMNS = tuple(c.name for c in JournalEntry.__table__.columns) + ('username',)
+EXPORT_ARRAY_COLUMNS = frozenset(TAG_SOURCES.values())
+# colonne testuali: celle che Excel interpreterebbe come formula vengono neutralizzate con '
+EXPORT_TEXT_COLUMNS = frozenset(c.name for c in JournalEntry.__table__.columns
+                                 if isinstance(c.type, db.String)) | {'username'}
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+EXPORT_FORMATS = {'csv': ('text/csv', 'csv'), 'jsonl': ('application/x-ndjson', 'jsonl'),
+                  'columnar': ('application/x-ndjson', 'columns.jsonl')}
+
+# Filtri della dashboard + JOIN su User (per lo username); admin: tutti gli utenti,
+# oppure uno solo con user=<username>
+def export_query(user, args):
+    query = filtered_trades_query(user, args).join(User, JournalEntry.author)
+    if user.role == 'admin' and args.get('user'):
+        query = query.filter(User.username == args['user'])
+    return query
+
+# Righe come tuple, mai oggetti ORM; yield_per usa un cursore lato server (stream_results)
+# e scarica i risultati a blocchi, la memoria resta costante qualunque sia la tabella
+def export_rows(query, chunk_size=1000):
+    cols = list(JournalEntry.__table__.columns) + [User.username]
+    return query.with_entities(*cols).order_by(JournalEntry.date, JournalEntry.id).yield_per(chunk_size)
+
+# Come export_rows ma a blocchi keyset chiusi (nessun cursore aperto tra un blocco e
+# l'altro): tra un blocco e il successivo si può scrivere l'avanzamento, anche su SQLite
+def export_rows_chunked(query, chunk_size=5000, on_chunk=None):
+    cols = list(JournalEntry.__table__.columns) + [User.username]
+    base = query.with_entities(*cols).order_by(JournalEntry.date, JournalEntry.id)
+    last, done = None, 0
+    while True:
+        q = base if last is None else base.filter(db.tuple_(JournalEntry.date, JournalEntry.id) > last)
+        rows = q.limit(chunk_size).all()
+        if not rows: return
+        yield from rows
+        done += len(rows)
+        last = (rows[-1].date, rows[-1].id)
+        if on_chunk: on_chunk(done)
+
+def export_record(row):
+    rec = dict(zip(EXPORT_COLUMNS, row))
+    if rec['date'] is not None: rec['date'] = rec['date'].isoformat()
+    for f in EXPORT_ARRAY_COLUMNS: rec[f] = split_tags(rec[f])
+    return rec
+
+def export_csv_cell(field, value):
+    if value is None:
+        return value
+    if field == 'date':
+        return value.isoformat()
+    if field in EXPORT_TEXT_COLUMNS and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+def export_csv(rows):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(export_csv_cell(f, v) for f, v in zip(EXPORT_COLUMNS, row))
+        if buf.tell() > 65536:
+            yield buf.getvalue()
+            buf.seek(0); buf.truncate()
+    yield buf.getvalue()
+
+def export_jsonl(rows):
+    for row in rows:
+        yield json.dumps(export_record(row), ensure_ascii=False) + "\n"
+
+# Formato colonnare a gruppi di righe (come i row group di Parquet): una riga JSON per
+# blocco, con un array per colonna
+def export_columnar(rows, group_size=1000):
+    group = []
+    for row in rows:
+        group.append(export_record(row))
+        if len(group) >= group_size:
+            yield json.dumps({f: [r[f] for r in group] for f in EXPORT_COLUMNS}, ensure_ascii=False) + "\n"
+            group = []
+    if group:
+        yield json.dumps({f: [r[f] for r in group] for f in EXPORT_COLUMNS}, ensure_ascii=False) + "\n"
+
+EXPORT_WRITERS = {'csv': export_csv, 'jsonl': export_jsonl, 'columnar': export_columnar}
+
+# --- JOB IN BACKGROUND ---
+# Calcoli pesanti (payload statistiche, Monte Carlo, export) in un pool di processi, fuori
+# dal ciclo della richiesta. Stato e risultati stanno in analytics_job (i file degli export
+# in JOB_DIR), quindi qualunque worker gunicorn può rispondere a /jobs/<id>.
+# I figli partono da forkserver (spawn dove manca), mai con fork dal worker: il worker ha altri
+# thread (gthread, pool bcrypt) e un fork ne erediterebbe i lock presi, pool del database compreso.
+job_executor = None
+job_executor_lock = threading.Lock()   # worker gthread: un solo pool anche con richieste concorrenti
+JOB_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Figlio morto (BrokenProcessPool) o job annullato: run_job non arriva a segnarlo fallito
+def job_done(job_id, future):
+    error = 'annullato' if future.cancelled() else future.exception()
+    if error is None: return
+    if isinstance(error, BaseException): error = f'{type(error).__name__}: {error}'
+    t = AnalyticsJob.__table__
+    with app.app_context(), db.engine.begin() as conn:
+        conn.execute(t.update().where(t.c.id == job_id, t.c.status.in_(('queued', 'running')))
+                     .values(status='failed', error=error, finished_at=datetime.utcnow()))
+
+def submit_job(user_id, kind, params, scope=None, version=None):
+    global job_executor
+    job = AnalyticsJob(id=uuid.uuid4().hex, user_id=user_id, kind=kind, scope=scope, version=version,
+                       params=json.dumps(params, sort_keys=True))
+    db.session.add(job)
+    db.session.commit()
+    with job_executor_lock:
+        for _ in range(2):
+            if job_executor is None:
+                job_executor = ProcessPoolExecutor(max_workers=app.config['JOB_WORKERS'],
+                                                   mp_context=multiprocessing.get_context(JOB_START_METHOD))
+            try:
+                future = job_executor.submit(run_job, job.id)
+                future.add_done_callback(lambda f, job_id=job.id: job_done(job_id, f))
+                break
+            except BrokenProcessPool:
+                job_executor = None   # un figlio è morto: nuovo pool e secondo tentativo
+    return job
+
+# Avanzamento su una connessione separata: non tocca la transazione del job
+def set_job_progress(job_id, progress):
+    t = AnalyticsJob.__table__
+    with db.engine.begin() as conn:
+        conn.execute(t.update().where(t.c.id == job_id).values(progress=int(progress)))
+
+def run_job(job_id):
+    with app.app_context():
+        job = db.session.get(AnalyticsJob, job_id)
+        job.status = 'running'
+        db.session.commit()
+        try:
+            result = JOB_HANDLERS[job.kind](job, json.loads(job.params))
+        except Exception as e:
+            db.session.rollback()
+            job.status, job.error = 'failed', f'{type(e).__name__}: {e}'
+        else:
+            job.status, job.progress, job.result = 'done', 100, json.dumps(result)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+def statistics_job(job, params):
+    stats = load_trade_stats(params['user_id'])
+    set_job_progress(job.id, 10)
+    return statistics_payload(params['user_id'], stats, params['month_ref'], params['mc_paths'])
+
+# Stessi input della card Risk of Ruin, con numero di percorsi e orizzonte a scelta
+def montecarlo_job(job, params):
+    tot = load_trade_stats(params['user_id']).get('all')
+    if not tot or tot['active'] <= 5 or not tot['loss_pl']:
+        return {str(t): 0 for t in montecarlo.DD_THRESHOLDS}
+    win_rate = round(tot['wins'] / tot['active'] * 100, 2)
+    avg_win = round(tot['win_pl'] / tot['wins'], 2) if tot['wins'] else 0
+    avg_loss = round(tot['loss_pl'] / tot['losses'], 2) if tot['losses'] else 0
+    return montecarlo.risk_of_ruin(win_rate / 100, avg_win, avg_loss, n_paths=params['mc_paths'], horizon=params['horizon'])
+
+def export_job(job, params):
+    user = db.session.get(User, job.user_id)
+    query = export_query(user, params)
+    total = query.count() or 1
+    mimetype, ext = EXPORT_FORMATS[params['format']]
+    os.makedirs(app.config['JOB_DIR'], exist_ok=True)
+    path = os.path.join(app.config['JOB_DIR'], f'{job.id}.{ext}')
+    rows = export_rows_chunked(query, on_chunk=lambda done: set_job_progress(job.id, done * 99 // total))
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in EXPORT_WRITERS[params['format']](rows):
+            f.write(chunk)
+    return {'file': os.path.basename(path), 'mimetype': mimetype,
+            'filename': f'journal_{datetime.now():%Y%m%d}.{ext}', 'size': os.path.getsize(path)}
+
+JOB_HANDLERS = {'statistics': statistics_job, 'montecarlo': montecarlo_job, 'export': export_job}
+
+# Un job rimasto queued/running oltre JOB_TIMEOUT (worker riavviato, processo ucciso) è fallito
+def expire_stale_job(job):
+    if job.status in ('queued', 'running') and datetime.utcnow() - job.created_at > timedelta(seconds=app.config['JOB_TIMEOUT']):
+        job.status, job.error, job.finished_at = 'failed', 'timeout', datetime.utcnow()
+        db.session.commit()
+    return job
+
+# Pagina statistiche su storici grandi: risposta immediata dall'ultimo snapshot completato
+# (anche se non aggiornato) più, se i dati sono cambiati, un job che ne calcola uno nuovo.
+# Ritorna (payload o None, job in corso o None, data dello snapshot)
+def statistics_snapshot(user, user_id, stats, selected_month_str, mc_paths):
+    scope = cache_scope(user_id)
+    etag = statistics_etag(user_id, stats, 'statistics', selected_month_str, mc_paths)
+    payload = result_cache.get(scope, etag)
+    if payload is not None:
+        return payload, None, None
+    params = json.dumps({'user_id': user_id, 'month_ref': selected_month_str, 'mc_paths': mc_paths}, sort_keys=True)
+    jobs = AnalyticsJob.query.filter_by(kind='statistics', scope=scope, params=params)
+    latest = jobs.filter_by(status='done').order_by(AnalyticsJob.created_at.desc()).first()
+    payload = json.loads(latest.result) if latest else None
+    if latest and latest.version == etag:
+        if payload is not None: result_cache.set(scope, etag, payload)
+        return payload, None, latest.finished_at
+    pending = jobs.filter(AnalyticsJob.version == etag, AnalyticsJob.status.in_(('queued', 'running'))).first()
+    if pending is None or expire_stale_job(pending).status == 'failed':
+        pending = submit_job(user.id, 'statistics', json.loads(params), scope, etag)
+    return payload, pending, latest.finished_at if latest else None
+
+@app.cli.command('purge-jobs')
+@click.option('--days', default=7, show_default=True, help='Elimina i job conclusi più vecchi di N giorni.')
+def purge_jobs_command(days):
+    old = AnalyticsJob.query.filter(AnalyticsJob.status.in_(('done', 'failed')),
+                                    AnalyticsJob.created_at < datetime.utcnow() - timedelta(days=days)).all()
+    for job in old:
+        if job.kind == 'export' and job.result:
+            path = os.path.join(app.config['JOB_DIR'], json.loads(job.result)['file'])
+            if os.path.exists(path): os.remove(path)
+        db.session.delete(job)
+    db.session.commit()
+    click.echo(f'Job eliminati: {len(old)}.')
+
+# --- REPORT COORTE (ADMIN) ---
+# Classifica degli studenti in una sola query: aggregati GROUP BY user_id, drawdown con
+# window function (equity cumulativa e picco progressivo per utente), ordinamento, totale
+# (COUNT(*) OVER ()) e paginazione nel database. Stesse definizioni dei KPI di statistics_payload.
+COHORT_PER_PAGE = 25
+COHORT_SORTS = ('username', 'trades', 'win_rate', 'profit_factor', 'net', 'avg_win_rr', 'daily_trades', 'max_drawdown')
+
+def cohort_drawdowns():
+    j = JournalEntry
+    order = (j.date, j.id)
+    curve = (db.select(j.user_id, j.date, j.id,
+                       db.func.sum(j.result_percent).over(partition_by=j.user_id, order_by=order).label('equity'))
+               .where(j.outcome.in_(ACTIVE_OUTCOMES), j.result_percent.isnot(None)).subquery())
+    peaks = db.select(curve.c.user_id, curve.c.equity,
+                      db.func.max(curve.c.equity).over(partition_by=curve.c.user_id, order_by=(curve.c.date, curve.c.id)).label('peak')).subquery()
+    peak = db.case((peaks.c.peak > 0, peaks.c.peak), else_=0)   # picco con partenza da 0, come equity.drawdown
+    return (db.select(peaks.c.user_id, db.func.max(peak - peaks.c.equity).label('max_drawdown'))
+              .group_by(peaks.c.user_id).subquery())
+
+def cohort_report(sort='net', descending=True, page=1, per_page=COHORT_PER_PAGE):
+    j = JournalEntry
+    res = db.func.coalesce(j.result_percent, 0)
+    is_win, is_loss = j.outcome == 'Target', j.outcome == 'Stop Loss'
+    agg = (db.select(j.user_id,
+                     db.func.count(j.id).label('trades'),
+                     db.func.sum(db.case((j.outcome.in_(ACTIVE_OUTCOMES), 1), else_=0)).label('active'),
+                     db.func.sum(db.case((is_win, 1), else_=0)).label('wins'),
+                     db.func.sum(db.case((is_win, res), else_=0)).label('win_pl'),
+                     db.func.abs(db.func.sum(db.case((is_loss, res), else_=0))).label('gross_loss'),
+                     db.func.avg(db.case((is_win, j.rr_final), else_=None)).label('avg_win_rr'),
+                     db.func.count(db.distinct(j.date)).label('days'))
+             .group_by(j.user_id).subquery())
+    dd = cohort_drawdowns()
+    columns = {
+        'username': User.username,
+        'trades': agg.c.trades,
+        'win_rate': db.case((agg.c.active > 0, agg.c.wins * 100.0 / agg.c.active), else_=0),
+        'profit_factor': db.case((agg.c.gross_loss > 0, agg.c.win_pl / agg.c.gross_loss), else_=agg.c.win_pl),
+        'net': agg.c.win_pl - agg.c.gross_loss,
+        'avg_win_rr': db.func.coalesce(agg.c.avg_win_rr, 0),
+        'daily_trades': agg.c.trades * 1.0 / agg.c.days,
+        'max_drawdown': db.func.coalesce(dd.c.max_drawdown, 0),
+    }
+    key = columns[sort]
+    query = (db.select(User.id, *[c.label(name) for name, c in columns.items()], agg.c.wins, agg.c.active, agg.c.days,
+                       db.func.count().over().label('total'))
+               .join(agg, agg.c.user_id == User.id).outerjoin(dd, dd.c.user_id == User.id)
+               .where(User.role == 'student')
+               .order_by(key.desc() if descending else key.asc(), User.username)
+               .limit(per_page).offset((page - 1) * per_page))
+    rows = db.session.execute(query).all()
+    return rows, (rows[0].total if rows else 0)
+
+# --- INDICI & PIANI DI ESECUZIONE ---
+# create_all non aggiunge indici a tabelle già esistenti: questo comando sì
+@app.cli.command('create-indexes')
+def create_indexes_command():
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+            click.echo(f'{table.name}: {index.name}')
+
+def explain(query):
+    sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    prefix = 'EXPLAIN QUERY PLAN ' if db.engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    return '\n'.join(str(r[-1]) for r in db.session.execute(db.text(prefix + sql)))
+
+# Verifica con EXPLAIN che le query di dashboard e statistiche usino gli indici
+@app.cli.command('check-plans')
+def check_plans_command():
+    if db.engine.dialect.name == 'postgresql':
+        # su tabelle piccole il planner preferisce il seq scan: qui conta che l'indice sia utilizzabile
+        db.session.execute(db.text('SET LOCAL enable_seqscan = off'))
+    student = User(id=1, role='student')
+    month = datetime.now().strftime('%Y-%m')
+    checks = {
+        'dashboard': filtered_trades_query(student, {}).order_by(JournalEntry.date.desc()).limit(15),
+        'dashboard pair+mese': filtered_trades_query(student, {'pair_filter': 'EURUSD', 'date_filter': month}).order_by(JournalEntry.date.desc()).limit(15),
+        'dashboard esito': filtered_trades_query(student, {'outcome_filter': 'Target'}).with_entities(db.func.count(JournalEntry.id)),
+        'dashboard tag': filtered_trades_query(student, {'tag_filter': 'pro:Trendline'}).order_by(JournalEntry.date.desc()).limit(15),
+        'statistics frame': filtered_trades_query(student, {}).with_entities(*[getattr(JournalEntry, c) for c in FRAME_COLUMNS]).order_by(JournalEntry.date.asc()),
+        'statistics giorni': filtered_trades_query(student, {}).with_entities(db.func.count(db.distinct(JournalEntry.date))),
+        'statistics tag': filtered_trades_query(student, {}).join(TradeTag, TradeTag.trade_id == JournalEntry.id).filter(TradeTag.kind == 'pro').with_entities(TradeTag.value, db.func.count(TradeTag.id)).group_by(TradeTag.value),
+    }
+    failed = []
+    for name, query in checks.items():
+        plan = explain(query)
+        ok = 'INDEX' in plan.upper()
+        click.echo(f"[{'OK' if ok else 'FAIL'}] {name}\n    " + plan.replace('\n', '\n    '))
+        if not ok: failed.append(name)
+    db.session.rollback()
+    if failed:
+        raise click.ClickException(f'Nessun indice usato da: {", ".join(failed)}')
 
 # --- ROUTES ---
 @app.route('/')
@@ -93,11 +1067,13 @@ def register():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
+        limited = login_rate_limited('register.html', None)
+        if limited: return limited
         if User.query.filter_by(username=username).first():
             flash('Utente già esistente.', 'danger')
             return redirect(url_for('register'))
         role = 'admin' if username == ADMIN_USER else 'student'
-        new_user = User(username=username, password=bcrypt.generate_password_hash(password).decode('utf-8'), role=role)
+        new_user = User(username=username, password=hash_password(password), role=role)
         db.session.add(new_user)
         db.session.commit()
         return redirect(url_for('login'))
@@ -106,8 +1082,14 @@ def register():
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
-        user = User.query.filter_by(username=request.form.get('username')).first()
-        if user and bcrypt.check_password_hash(user.password, request.form.get('password')):
+        username, password = request.form.get('username'), request.form.get('password')
+        limited = login_rate_limited('login.html', username)
+        if limited: return limited
+        user = User.query.options(db.undefer(User.password)).filter_by(username=username).first()
+        if user and check_password(user.password, password):
+            if hash_needs_update(user.password):
+                user.password = hash_password(password)
+                db.session.commit()
             login_user(user)
             return redirect(url_for('dashboard'))
         flash('Login fallito.', 'danger')
@@ -127,7 +1109,9 @@ def settings():
         current_user.pros_settings = ",".join([p.strip() for p in request.form.getlist('pros_item') if p.strip()])
         current_user.cons_settings = ",".join([c.strip() for c in request.form.getlist('cons_item') if c.strip()])
         current_user.custom_pairs = request.form.get('custom_pairs')
+        current_user.settings_rev = (current_user.settings_rev or 0) + 1
         db.session.commit()
+        result_cache.bump(cache_scope(current_user.id))
         flash('Setup aggiornato!', 'success')
         return redirect(url_for('settings'))
     
@@ -173,360 +1157,463 @@ def admin_panel():
                 flash(f'{target_username} è ora studente.', 'warning')
             db.session.commit()
             
-    users = User.query.all()
+    # solo le colonne mostrate + conteggio trade in un'unica query aggregata
+    users = (db.session.query(User.id, User.username, User.role, db.func.count(JournalEntry.id).label('trade_count'))
+             .outerjoin(JournalEntry, JournalEntry.user_id == User.id)
+             .group_by(User.id, User.username, User.role).order_by(User.id).all())
     return render_template('admin_users.html', users=users, super_admin=ADMIN_USER, user=current_user)
 
+@app.route('/admin/cohort')
+@login_required
+@read_replica
+def admin_cohort():
+    if current_user.role != 'admin':
+        abort(403)
+    sort = request.args.get('sort', 'net')
+    if sort not in COHORT_SORTS: sort = 'net'
+    descending = request.args.get('dir', 'asc' if sort == 'username' else 'desc') != 'asc'
+    page = max(1, request.args.get('page', 1, type=int))
+    with span('cohort'):
+        rows, total = cohort_report(sort, descending, page)
+    if not rows and page > 1:
+        return redirect(url_for('admin_cohort', sort=sort, dir='desc' if descending else 'asc'))
+    pages = max(1, math.ceil(total / COHORT_PER_PAGE))
+    return render_template('admin_cohort.html', rows=rows, total=total, page=page, pages=pages,
+                           sort=sort, descending=descending, per_page=COHORT_PER_PAGE, user=current_user)
+
 @app.route('/dashboard')
 @login_required
+@read_replica
 def dashboard():
-    pair_filter = request.args.get('pair_filter')
-    outcome_filter = request.args.get('outcome_filter')
-    date_filter = request.args.get('date_filter')
+    query = filtered_trades_query(current_user, request.args)
+    list_query = query
+    if current_user.role == 'admin':
+        # la colonna User della tabella: autore in JOIN, solo lo username
+        list_query = query.options(db.joinedload(JournalEntry.author).load_only(User.username))
 
-    query = JournalEntry.query
-    if current_user.role != 'admin':
-        query = query.filter_by(user_id=current_user.id)
-    
-    if pair_filter: query = query.filter(JournalEntry.pair == pair_filter)
-    if outcome_filter: query = query.filter(JournalEntry.outcome == outcome_filter)
-    if date_filter:
-        year, month = date_filter.split('-')
-        query = query.filter(db.extract('year', JournalEntry.date) == int(year))
-        query = query.filter(db.extract('month', JournalEntry.date) == int(month))
+    # --- FILTER STATS (un solo aggregato SQL, nessun trade caricato) ---
+    with span('filter_stats'):
+        total, net_profit, active, wins, avg_rr = query.with_entities(
+            db.func.count(JournalEntry.id),
+            db.func.sum(db.func.coalesce(JournalEntry.result_percent, 0)),
+            db.func.sum(db.case((JournalEntry.outcome.in_(ACTIVE_OUTCOMES), 1), else_=0)),
+            db.func.sum(db.case((JournalEntry.outcome == 'Target', 1), else_=0)),
+            db.func.avg(db.case((JournalEntry.rr_final > 0, JournalEntry.rr_final), else_=None)),
+        ).one()
+        filter_stats = {'total': total, 'net_profit': 0, 'win_rate': 0, 'avg_rr': 0}
+        if total:
+            filter_stats['net_profit'] = round(float(net_profit or 0), 2)
+            if active: filter_stats['win_rate'] = round((wins / active) * 100, 1)
+            if avg_rr is not None: filter_stats['avg_rr'] = round(float(avg_rr), 2)
 
-    filtered_trades = query.all()
-    filter_stats = {'total': len(filtered_trades), 'net_profit': 0, 'win_rate': 0, 'avg_rr': 0}
-    
-    if filtered_trades:
-        active = [t for t in filtered_trades if t.outcome in ['Target', 'Stop Loss', 'Breakeven']]
-        wins = [t for t in active if t.outcome == 'Target']
-        filter_stats['net_profit'] = round(sum((t.result_percent or 0) for t in filtered_trades), 2)
-        if len(active) > 0: filter_stats['win_rate'] = round((len(wins) / len(active)) * 100, 1)
-        rrs = [t.rr_final for t in filtered_trades if t.rr_final is not None and t.rr_final > 0]
-        if rrs: filter_stats['avg_rr'] = round(sum(rrs) / len(rrs), 2)
-
-    page = request.args.get('page', 1, type=int)
-    pagination = query.order_by(JournalEntry.date.desc()).paginate(page=page, per_page=15, error_out=False)
+    with span('page'):
+        keyset = request.args.get('pagination', app.config['DASHBOARD_PAGINATION']) == 'keyset'
+        if keyset:
+            pagination = KeysetPage(list_query, request.args.get('cursor'))
+        else:
+            # il COUNT della paginazione è già nell'aggregato
+            page = request.args.get('page', 1, type=int)
+            pagination = list_query.order_by(JournalEntry.date.desc(), JournalEntry.id.desc()).paginate(page=page, per_page=15, error_out=False, count=False)
+            pagination.total = total
+    nav_args = {k: v for k, v in request.args.items() if k not in ('page', 'cursor')}
     
-    u_pros = [p for p in (current_user.pros_settings.split(',') if current_user.pros_settings else []) if p]
-    u_cons = [c for c in (current_user.cons_settings.split(',') if current_user.cons_settings else []) if c]
-    custom_pairs_list = [p.strip().upper() for p in (current_user.custom_pairs.split(',') if current_user.custom_pairs else []) if p.strip()]
+    u_pros, u_cons, custom_pairs_list = user_setting_lists(current_user)
 
-    return render_template('dashboard.html', pagination=pagination, admin_view=(current_user.role == 'admin'), 
-                           user=current_user, user_pros=u_pros, user_cons=u_cons, 
-                           filter_stats=filter_stats, custom_pairs=custom_pairs_list)
+    with span('render'):
+        return render_template('dashboard.html', pagination=pagination, keyset=keyset, nav_args=nav_args,
+                               admin_view=(current_user.role == 'admin'), user=current_user, user_pros=u_pros, user_cons=u_cons, 
+                               filter_stats=filter_stats, custom_pairs=custom_pairs_list)
 
-@app.route('/statistics')
-@login_required
-def statistics_page():
-    admin_view = (current_user.role == 'admin')
+# --- STATISTICHE ---
+# Aggregati dello scope (utente, o tutti per l'admin); ricostruiti al volo se mancanti
+def scope_trade_stats(user):
+    user_id = None if user.role == 'admin' else user.id
+    stats = load_trade_stats(user_id)
+    # senza riga 'all' ricostruisce solo se ci sono trade: uno studente senza trade non ha
+    # aggregati e non deve pagare DELETE + COMMIT (e il passaggio al primario) ad ogni pagina
+    if user_id is not None and 'all' not in stats and \
+            db.session.query(JournalEntry.query.filter_by(user_id=user_id).exists()).scalar():
+        rebuild_trade_stats(user_id)
+        stats = load_trade_stats(user_id)
+    return user_id, stats
+
+def statistics_params(args):
+    selected_month_str = args.get('month_ref', datetime.now().strftime('%Y-%m'))
+    mc_paths = max(1, min(args.get('mc_paths', montecarlo.DEFAULT_PATHS, type=int), montecarlo.MAX_PATHS))
+    return selected_month_str, mc_paths
+
+# Tutti i KPI e le tabelle della pagina statistiche; None se non ci sono trade
+def statistics_payload(user_id, stats, selected_month_str, mc_paths):
     base_query = JournalEntry.query
-    if not admin_view:
-        base_query = base_query.filter_by(user_id=current_user.id)
-    
-    selected_month_str = request.args.get('month_ref', datetime.now().strftime('%Y-%m'))
+    if user_id is not None:
+        base_query = base_query.filter_by(user_id=user_id)
     sel_year, sel_month = map(int, selected_month_str.split('-'))
 
-    trades = base_query.order_by(JournalEntry.date.asc()).all()
-    
-    unique_dates = set(t.date for t in trades)
-    total_days = len(unique_dates)
-
-    if not trades: 
-        return render_template('statistics.html', no_data=True, user=current_user, admin_view=admin_view, total_trades=0, total_days=0)
+    # --- BASE KPI (da aggregati, indipendente dalla lunghezza dello storico) ---
+    empty = dict.fromkeys(TRADE_STAT_FIELDS + ('rev',), 0)
+    tot = stats.get('all', empty)
+    if not tot['n']:
+        return None
 
-    # --- BASE KPI ---
-    active_trades = [t for t in trades if t.outcome in ['Target', 'Stop Loss', 'Breakeven']]
-    wins = [(t.result_percent or 0) for t in active_trades if t.outcome == 'Target']
-    losses = [(t.result_percent or 0) for t in active_trades if t.outcome == 'Stop Loss']
-    
-    total_active = len(active_trades)
-    num_wins = len(wins)
-    num_losses = len(losses)
+    total_days = base_query.with_entities(db.func.count(db.distinct(JournalEntry.date))).scalar() or 0
+    total_active = tot['active']
+    num_wins = tot['wins']
+    num_losses = tot['losses']
     
     win_rate = round((num_wins / total_active * 100), 2) if total_active > 0 else 0
-    gross_profit = sum(wins)
-    gross_loss = abs(sum(losses))
+    gross_profit = tot['win_pl'] if num_wins else 0
+    gross_loss = abs(tot['loss_pl']) if num_losses else 0
     net_result = round(gross_profit - gross_loss, 2)
     profit_factor = round(gross_profit / gross_loss, 2) if gross_loss > 0 else round(gross_profit, 2)
     
     # --- AVG RR (SOLO SU WINNING TRADES) ---
-    win_rr_vals = [t.rr_final for t in active_trades if t.outcome == 'Target' and t.rr_final is not None]
-    avg_win_rr = round(sum(win_rr_vals) / len(win_rr_vals), 2) if win_rr_vals else 0
+    avg_win_rr = round(tot['win_rr_sum'] / tot['win_rr_n'], 2) if tot['win_rr_n'] else 0
     
-    unique_weeks = len(set(t.date.strftime('%Y-%W') for t in trades))
-    avg_weekly_trades = round(len(trades) / unique_weeks, 1) if unique_weeks > 0 else len(trades)
+    unique_weeks = len([b for b, v in stats.items() if b.startswith('yw:') and v['n'] > 0])
+    avg_weekly_trades = round(tot['n'] / unique_weeks, 1) if unique_weeks > 0 else tot['n']
 
     # --- NUOVA METRICA RICHIESTA: TRADES / GIORNO OPERATIVO ---
-    avg_daily_trades = round(len(trades) / total_days, 1) if total_days > 0 else 0
+    avg_daily_trades = round(tot['n'] / total_days, 1) if total_days > 0 else 0
 
-    returns = [(t.result_percent or 0) for t in active_trades]
-    std_dev = statistics.stdev(returns) if len(returns) > 1 else 0
-    avg_return = statistics.mean(returns) if returns else 0
+    # deviazione standard campionaria da somma e somma dei quadrati
+    std_dev = 0
+    if total_active > 1:
+        var = (tot['active_pl_sq'] - tot['active_pl'] ** 2 / total_active) / (total_active - 1)
+        std_dev = math.sqrt(var) if var > 0 else 0
+    avg_return = tot['active_pl'] / total_active if total_active else 0
     sharpe_ratio = round(avg_return / std_dev, 2) if std_dev > 0 else 0
     
-    avg_win = round(statistics.mean(wins), 2) if wins else 0
-    avg_loss = round(statistics.mean(losses), 2) if losses else 0
+    avg_win = round(tot['win_pl'] / num_wins, 2) if num_wins else 0
+    avg_loss = round(tot['loss_pl'] / num_losses, 2) if num_losses else 0
     
     # --- LONG vs SHORT ANALYSIS ---
-    long_trades = [t for t in active_trades if t.direction == 'Long']
-    short_trades = [t for t in active_trades if t.direction == 'Short']
-    
-    long_stats = {
-        'total': len(long_trades),
-        'wins': len([t for t in long_trades if t.outcome == 'Target']),
-        'win_rate': 0
-    }
+    long_row, short_row = stats.get('dir:Long', empty), stats.get('dir:Short', empty)
+    long_stats = {'total': long_row['n'], 'wins': long_row['wins'], 'win_rate': 0}
     if long_stats['total'] > 0: 
         long_stats['win_rate'] = round(long_stats['wins'] / long_stats['total'] * 100, 1)
         
-    short_stats = {
-        'total': len(short_trades),
-        'wins': len([t for t in short_trades if t.outcome == 'Target']),
-        'win_rate': 0
-    }
+    short_stats = {'total': short_row['n'], 'wins': short_row['wins'], 'win_rate': 0}
     if short_stats['total'] > 0: 
         short_stats['win_rate'] = round(short_stats['wins'] / short_stats['total'] * 100, 1)
 
-    # --- RISK OF RUIN ---
-    risk_of_ruin = {'10': 0, '20': 0, '100': 0}
-    if total_active > 5:
-        if gross_loss == 0:
-            risk_of_ruin = {'10': 0, '20': 0, '100': 0}
-        else:
-            win_prob = win_rate / 100
-            loss_prob = 1 - win_prob
-            mc_drawdowns = []
-            for _ in range(1000): 
-                sim_equity = 0
-                max_dd = 0
-                peak = 0
-                for _ in range(100):
-                    outcome = random.choices([avg_win, avg_loss], weights=[win_prob, loss_prob])[0]
-                    sim_equity += outcome
-                    peak = max(peak, sim_equity)
-                    dd = peak - sim_equity
-                    max_dd = max(max_dd, dd)
-                mc_drawdowns.append(max_dd)
-            risk_of_ruin['10'] = round(len([d for d in mc_drawdowns if d >= 10]) / 1000 * 100, 1)
-            risk_of_ruin['20'] = round(len([d for d in mc_drawdowns if d >= 20]) / 1000 * 100, 1)
-            risk_of_ruin['100'] = round(len([d for d in mc_drawdowns if d >= 100]) / 1000 * 100, 1)
-
-    # --- CALENDAR ---
-    month_trades = [t for t in trades if t.date.year == sel_year and t.date.month == sel_month]
-    month_pl = sum([(t.result_percent or 0) for t in month_trades])
-    cal_obj = cal_module.Calendar(firstweekday=6) 
-    month_days = cal_obj.monthdayscalendar(sel_year, sel_month)
-    calendar_data = []
-    for week in month_days:
-        week_stats = {'days': [], 'week_pl': 0, 'trade_count': 0}
-        for day in week:
-            if day == 0:
-                week_stats['days'].append(None)
-            else:
-                d_trades = [t for t in month_trades if t.date.day == day]
-                d_pl = round(sum([(t.result_percent or 0) for t in d_trades]), 2)
-                d_count = len(d_trades)
-                week_stats['days'].append({'day': day, 'pl': d_pl, 'count': d_count})
-                week_stats['week_pl'] += d_pl
-                week_stats['trade_count'] += d_count
-        week_stats['week_pl'] = round(week_stats['week_pl'], 2)
-        calendar_data.append(week_stats)
-
     # --- TOP WEEKS ---
-    week_performance = {1: {'wins':0, 'total':0, 'pl':0}, 2: {'wins':0, 'total':0, 'pl':0}, 
-                        3: {'wins':0, 'total':0, 'pl':0}, 4: {'wins':0, 'total':0, 'pl':0}, 5: {'wins':0, 'total':0, 'pl':0}}
-    for t in trades:
-        w_num = (t.date.day - 1) // 7 + 1
-        if w_num > 5: w_num = 5
-        week_performance[w_num]['total'] += 1
-        week_performance[w_num]['pl'] += (t.result_percent or 0)
-        if t.outcome == 'Target': week_performance[w_num]['wins'] += 1
     week_table = []
-    for w, data in week_performance.items():
-        if data['total'] > 0:
-            wr = round(data['wins']/data['total']*100, 1)
-            week_table.append({'name': f"Settimana {w}", 'win_rate': wr, 'pl': round(data['pl'], 2), 'total': data['total']})
+    for w in range(1, 6):
+        data = stats.get(f"wk:{w}", empty)
+        if data['n'] > 0:
+            wr = round(data['wins']/data['n']*100, 1)
+            week_table.append({'name': f"Settimana {w}", 'win_rate': wr, 'pl': round(data['pl'], 2), 'total': data['n']})
     week_table.sort(key=lambda x: x['pl'], reverse=True)
     best_week = week_table[0]['name'] if week_table else "N/D"
 
-    # --- HELPER PER TABELLE ---
-    def make_stats_table(stats_dict):
-        table = []
-        for key, data in stats_dict.items():
-            wr = round(data['wins']/data['total']*100, 1) if data['total'] > 0 else 0
-            row_type = data.get('type', None)
-            table.append({'name': key, 'total': data['total'], 'win_rate': wr, 'result': round(data['pl'], 2), 'type': row_type})
-        table.sort(key=lambda x: x['result'], reverse=True)
-        return table
-
-    # --- TIMEFRAMES ---
-    tf_stats = {}
-    for t in active_trades:
-        if t.timeframe:
-            for tf in t.timeframe.split(','):
-                tf = tf.strip()
-                if tf not in tf_stats: tf_stats[tf] = {'total': 0, 'wins': 0, 'pl': 0}
-                tf_stats[tf]['total'] += 1
-                tf_stats[tf]['pl'] += (t.result_percent or 0)
-                if t.outcome == 'Target': tf_stats[tf]['wins'] += 1
-    tf_table = make_stats_table(tf_stats)
-
-    # --- ALIGNMENT ---
-    align_stats = {}
-    for t in active_trades:
-        if t.alignment:
-            for al in t.alignment.split(','):
-                al = al.strip()
-                if al not in align_stats: align_stats[al] = {'total': 0, 'wins': 0, 'pl': 0}
-                align_stats[al]['total'] += 1
-                align_stats[al]['pl'] += (t.result_percent or 0)
-                if t.outcome == 'Target': align_stats[al]['wins'] += 1
-    align_table = make_stats_table(align_stats)
-
-    # --- CONFLUENZE UNIFICATE (PROS & CONS) ---
-    confluences_stats = {}
-    
-    # Processa Pros
-    for t in active_trades:
-        if t.selected_pros:
-            for p in t.selected_pros.split(','):
-                p = p.strip()
-                if not p: continue
-                if p not in confluences_stats: confluences_stats[p] = {'total': 0, 'wins': 0, 'pl': 0, 'type': 'Pro'}
-                confluences_stats[p]['total'] += 1
-                confluences_stats[p]['pl'] += (t.result_percent or 0)
-                if t.outcome == 'Target': confluences_stats[p]['wins'] += 1
-                
-    # Processa Cons
-    for t in active_trades:
-        if t.selected_cons:
-            for c in t.selected_cons.split(','):
-                c = c.strip()
-                if not c: continue
-                key = c
-                if key in confluences_stats and confluences_stats[key]['type'] == 'Pro':
-                    key = c + " (Rischio)"
-                
-                if key not in confluences_stats: confluences_stats[key] = {'total': 0, 'wins': 0, 'pl': 0, 'type': 'Contro'}
-                confluences_stats[key]['total'] += 1
-                confluences_stats[key]['pl'] += (t.result_percent or 0)
-                if t.outcome == 'Target': confluences_stats[key]['wins'] += 1
-                
-    confluences_table = make_stats_table(confluences_stats)
-
-    # --- ANALISI EMOZIONI ---
-    emotions_stats = {}
-    for t in active_trades:
-        emo = t.emotions if t.emotions else "Non specificato"
-        if emo not in emotions_stats: emotions_stats[emo] = {'total': 0, 'wins': 0, 'pl': 0}
-        emotions_stats[emo]['total'] += 1
-        emotions_stats[emo]['pl'] += (t.result_percent or 0)
-        if t.outcome == 'Target': emotions_stats[emo]['wins'] += 1
-    emotions_table = make_stats_table(emotions_stats)
-
-
     # --- TOP DAYS ---
     day_map = {0: 'Lun', 1: 'Mar', 2: 'Mer', 3: 'Gio', 4: 'Ven', 5: 'Sab', 6: 'Dom'}
-    day_stats = {d: {'wins': 0, 'total': 0, 'res': 0} for d in day_map.values()}
-    for t in trades:
-        d = day_map[t.date.weekday()]
-        day_stats[d]['total'] += 1
-        day_stats[d]['res'] += (t.result_percent or 0)
-        if t.outcome == 'Target': day_stats[d]['wins'] += 1
     day_table = []
-    for d, data in day_stats.items():
-        if data['total'] > 0:
-            wr = round(data['wins']/data['total']*100, 1)
-            day_table.append({'name': d, 'total': data['total'], 'win_rate': wr, 'res': round(data['res'], 2)})
+    for wd, d in day_map.items():
+        data = stats.get(f"wd:{wd}", empty)
+        if data['n'] > 0:
+            wr = round(data['wins']/data['n']*100, 1)
+            day_table.append({'name': d, 'total': data['n'], 'win_rate': wr, 'res': round(data['pl'], 2)})
     day_table.sort(key=lambda x: x['res'], reverse=True)
 
+    # --- CARICAMENTO COLONNARE (una sola query, nessun oggetto ORM) ---
+    with span('load_trades'):
+        frame = TradeFrame(base_query.with_entities(*[getattr(JournalEntry, c) for c in FRAME_COLUMNS])
+                                     .order_by(JournalEntry.date.asc()).all())
+
+    # --- RISK OF RUIN ---
+    with span('monte_carlo'):
+        risk_of_ruin = {str(t): 0 for t in montecarlo.DD_THRESHOLDS}
+        if total_active > 5 and gross_loss > 0:
+            risk_of_ruin = montecarlo.risk_of_ruin(win_rate / 100, avg_win, avg_loss, n_paths=mc_paths)
+
+    # --- CALENDAR ---
+    with span('calendar'):
+        month_stat = stats.get(f"m:{sel_year:04d}-{sel_month:02d}", empty)
+        month_pl = round(month_stat['pl'], 2)
+        calendar_data = month_calendar(user_id, sel_year, sel_month, month_stat)
+
+    # --- TABELLE PER TAG (riduzioni raggruppate sul frame) ---
+    with span('tag_tables'):
+        tf_table = make_stats_table(tag_stats(base_query, 'timeframe'))
+        align_table = make_stats_table(tag_stats(base_query, 'alignment'))
+        confluences_table = make_stats_table(merge_confluences(tag_stats(base_query, 'pro', 'Pro'), tag_stats(base_query, 'con', 'Contro')))
+        emotions_table = make_stats_table(frame.emotion_stats())
+
     # --- CHART & MONTE CARLO ---
-    mc_simulations = []
-    real_returns = [(t.result_percent or 0) for t in active_trades]
-    if len(real_returns) > 5:
-        for _ in range(20):
-            sim_curve = []
-            cum_pl = 0
-            shuffled = random.choices(real_returns, k=len(real_returns)) 
-            for r in shuffled:
-                cum_pl += r
-                sim_curve.append(round(cum_pl, 2))
-            mc_simulations.append(sim_curve)
+    with span('equity_curve'):
+        # curva ridotta a EQUITY_MAX_POINTS con LTTB; le simulazioni negli stessi punti
+        curve = frame.equity_curve(max_points=EQUITY_MAX_POINTS)
+        chart_labels, chart_data = curve['labels'], curve['data']
+        mc_simulations = []
+        real_returns = frame.active_returns()
+        if len(real_returns) > 5:
+            mc_simulations = montecarlo.bootstrap_curves(real_returns, at=curve['index'])
     
-    chart_labels, chart_data = [], []
-    run_tot = 0
-    chronological = sorted(trades, key=lambda x: x.date)
-    for t in chronological:
-        if t.outcome in ['Target', 'Stop Loss', 'Breakeven'] and t.result_percent is not None:
-            run_tot += t.result_percent
-            chart_labels.append(t.date.strftime('%d/%m'))
-            chart_data.append(round(run_tot, 2))
-    
-    projection_data = []
-    if total_active > 0:
-        expectancy = (avg_win * (win_rate/100)) - (abs(avg_loss) * ((100-win_rate)/100))
-        last_equity = chart_data[-1] if chart_data else 0
-        projection_data = [last_equity] 
-        for i in range(1, 21):
-            projection_data.append(round(last_equity + (expectancy * i), 2))
-
-    return render_template('statistics.html', no_data=False, user=current_user, admin_view=admin_view,
-                           win_rate=win_rate, profit_factor=profit_factor, net_result=net_result, 
-                           avg_weekly_trades=avg_weekly_trades, sharpe_ratio=sharpe_ratio, risk_of_ruin=risk_of_ruin,
-                           avg_win_rr=avg_win_rr, avg_daily_trades=avg_daily_trades, # Passato al template
-                           long_stats=long_stats, short_stats=short_stats, 
-                           total_active=total_active, total_trades=len(trades), num_wins=num_wins, num_losses=num_losses,
-                           tf_table=tf_table, align_table=align_table, day_table=day_table, week_table=week_table,
-                           confluences_table=confluences_table, emotions_table=emotions_table, 
-                           chart_labels=json.dumps(chart_labels), chart_data=json.dumps(chart_data),
-                           mc_simulations=json.dumps(mc_simulations), projection_data=json.dumps(projection_data),
-                           calendar_data=calendar_data, month_pl=month_pl,
-                           selected_month=selected_month_str, best_week=best_week, 
-                           total_days=total_days)
+        projection_data = []
+        if total_active > 0:
+            expectancy = (avg_win * (win_rate/100)) - (abs(avg_loss) * ((100-win_rate)/100))
+            last_equity = chart_data[-1] if chart_data else 0
+            projection_data = [last_equity] 
+            for i in range(1, 21):
+                projection_data.append(round(last_equity + (expectancy * i), 2))
+
+    # --- ANDAMENTO (finestre mobili, serie, periodi di drawdown: un passaggio in streaming) ---
+    with span('rolling'):
+        trend = rolling_analytics(user_id)
+
+    return dict(win_rate=win_rate, profit_factor=profit_factor, net_result=net_result, 
+                avg_weekly_trades=avg_weekly_trades, sharpe_ratio=sharpe_ratio, risk_of_ruin=risk_of_ruin, mc_paths=mc_paths,
+                avg_win_rr=avg_win_rr, avg_daily_trades=avg_daily_trades,
+                long_stats=long_stats, short_stats=short_stats, 
+                total_active=total_active, total_trades=tot['n'], num_wins=num_wins, num_losses=num_losses,
+                tf_table=tf_table, align_table=align_table, day_table=day_table, week_table=week_table,
+                confluences_table=confluences_table, emotions_table=emotions_table, 
+                chart_labels=chart_labels, chart_data=chart_data,
+                max_drawdown=curve['max_drawdown'], max_dd_days=curve['max_dd_days'],
+                mc_simulations=mc_simulations, projection_data=projection_data, trend=trend,
+                calendar_data=calendar_data, month_pl=month_pl,
+                selected_month=selected_month_str, best_week=best_week, 
+                total_days=total_days)
+
+# --- EQUITY CURVE ---
+EQUITY_MAX_POINTS = 500
+EQUITY_POINTS_LIMIT = 10_000
+
+# Per trade: solo data e risultato dei trade attivi. Per giorno / settimana / mese: SUM
+# raggruppato per data (al più un punto per giorno di trading), il resto in equity.resample
+def equity_series(user_id, resolution='trade', max_points=EQUITY_MAX_POINTS):
+    q = JournalEntry.query.filter(JournalEntry.outcome.in_(ACTIVE_OUTCOMES), JournalEntry.result_percent.isnot(None))
+    if user_id is not None: q = q.filter_by(user_id=user_id)
+    if resolution == 'trade':
+        rows = q.with_entities(JournalEntry.date, JournalEntry.result_percent).order_by(JournalEntry.date, JournalEntry.id).all()
+    else:
+        rows = (q.with_entities(JournalEntry.date, db.func.sum(JournalEntry.result_percent))
+                 .group_by(JournalEntry.date).order_by(JournalEntry.date).all())
+    curve = equity.equity_curve([d.toordinal() for d, _ in rows], [pl for _, pl in rows], resolution, max_points)
+    del curve['index']
+    return curve
+
+# --- ANDAMENTO (ANALISI IN STREAMING) ---
+ROLLING_WINDOW_LIMIT = 1000
+ROLLING_MAX_WINDOWS = 4
+
+# Trade attivi in ordine di data letti a blocchi (yield_per: cursore lato server su PostgreSQL)
+# e passati una volta sola a rolling.TradeStream: memoria costante con qualunque storico
+def rolling_analytics(user_id, windows=rolling.DEFAULT_WINDOWS, max_points=rolling.DEFAULT_MAX_POINTS):
+    q = JournalEntry.query.filter(JournalEntry.outcome.in_(ACTIVE_OUTCOMES), JournalEntry.result_percent.isnot(None))
+    if user_id is not None: q = q.filter_by(user_id=user_id)
+    rows = (q.with_entities(JournalEntry.date, JournalEntry.outcome, JournalEntry.result_percent)
+             .order_by(JournalEntry.date, JournalEntry.id).yield_per(5000))
+    return rolling.analyze(rows, windows, max_points)
+
+def rolling_params(args):
+    windows = rolling.DEFAULT_WINDOWS
+    if args.get('windows'):
+        try:
+            windows = tuple(sorted({int(w) for w in args['windows'].split(',') if w.strip()}))
+        except ValueError:
+            abort(400)
+        if not windows or len(windows) > ROLLING_MAX_WINDOWS or not all(2 <= w <= ROLLING_WINDOW_LIMIT for w in windows):
+            abort(400)
+    max_points = max(2, min(args.get('points', rolling.DEFAULT_MAX_POINTS, type=int), EQUITY_POINTS_LIMIT))
+    return windows, max_points
+
+# ETag forte: cambia con numero di trade, id massimo e contatore di scritture dello scope
+def statistics_etag(user_id, stats, *params):
+    q = JournalEntry.query
+    if user_id is not None: q = q.filter_by(user_id=user_id)
+    max_id = q.with_entities(db.func.max(JournalEntry.id)).scalar()
+    tot = stats.get('all', {})
+    raw = f"{user_id}|{tot.get('n', 0)}|{max_id}|{tot.get('rev', 0)}|" + "|".join(map(str, params))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+# Payload condiviso tra pagina e API; la chiave è l'ETag (versione dei dati + parametri)
+def cached_statistics_payload(user_id, stats, selected_month_str, mc_paths, etag=None):
+    etag = etag or statistics_etag(user_id, stats, 'statistics', selected_month_str, mc_paths)
+    with span('payload'):
+        return result_cache.get_or_set(cache_scope(user_id), etag,
+                                       lambda: statistics_payload(user_id, stats, selected_month_str, mc_paths))
+
+def json_conditional(etag, build):
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/statistics')
+@login_required
+@read_replica
+def statistics_page():
+    admin_view = (current_user.role == 'admin')
+    selected_month_str, mc_paths = statistics_params(request.args)
+    user_id, stats = scope_trade_stats(current_user)
+    job, snapshot_at = None, None
+    if stats.get('all', {}).get('n', 0) >= app.config['STATS_ASYNC_MIN_TRADES']:
+        payload, job, snapshot_at = statistics_snapshot(current_user, user_id, stats, selected_month_str, mc_paths)
+    else:
+        payload = cached_statistics_payload(user_id, stats, selected_month_str, mc_paths)
+    if payload is None:
+        return render_template('statistics.html', no_data=True, user=current_user, admin_view=admin_view, total_trades=0, total_days=0,
+                               job=job)
+    with span('render'):
+        payload = dict(payload)   # la voce in cache resta intatta
+        for key in ('chart_labels', 'chart_data', 'mc_simulations', 'projection_data'):
+            payload[key] = json.dumps(payload[key])
+        return render_template('statistics.html', no_data=False, user=current_user, admin_view=admin_view,
+                               job=job, snapshot_at=snapshot_at, **payload)
+
+@app.route('/metrics')
+@login_required
+def metrics():
+    if current_user.role != 'admin':
+        abort(403)
+    return Response(instrumentation.metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/statistics')
+@login_required
+@read_replica
+def api_statistics():
+    selected_month_str, mc_paths = statistics_params(request.args)
+    user_id, stats = scope_trade_stats(current_user)
+    etag = statistics_etag(user_id, stats, 'statistics', selected_month_str, mc_paths)
+    return json_conditional(etag, lambda: cached_statistics_payload(user_id, stats, selected_month_str, mc_paths, etag) or {'no_data': True})
+
+@app.route('/api/equity')
+@login_required
+@read_replica
+def api_equity():
+    resolution = request.args.get('resolution', 'trade')
+    if resolution not in equity.RESOLUTIONS: abort(400)
+    # sempre tra 3 (estremi + un bucket LTTB) e EQUITY_POINTS_LIMIT: nessuna richiesta ottiene la curva completa di tutti i trade
+    max_points = max(3, min(request.args.get('points', EQUITY_MAX_POINTS, type=int), EQUITY_POINTS_LIMIT))
+    user_id, stats = scope_trade_stats(current_user)
+    etag = statistics_etag(user_id, stats, 'equity', resolution, max_points)
+    return json_conditional(etag, lambda: result_cache.get_or_set(cache_scope(user_id), etag, lambda: equity_series(user_id, resolution, max_points)))
+
+@app.route('/api/rolling')
+@login_required
+@read_replica
+def api_rolling():
+    windows, max_points = rolling_params(request.args)
+    user_id, stats = scope_trade_stats(current_user)
+    etag = statistics_etag(user_id, stats, 'rolling', ','.join(map(str, windows)), max_points)
+    return json_conditional(etag, lambda: result_cache.get_or_set(cache_scope(user_id), etag, lambda: rolling_analytics(user_id, windows, max_points)))
+
+# --- JOB ---
+@app.route('/jobs', methods=['POST'])
+@login_required
+def create_job():
+    kind = request.values.get('kind')
+    user_id, stats = scope_trade_stats(current_user)
+    if kind == 'statistics':
+        selected_month_str, mc_paths = statistics_params(request.values)
+        params = {'user_id': user_id, 'month_ref': selected_month_str, 'mc_paths': mc_paths}
+        version = statistics_etag(user_id, stats, 'statistics', selected_month_str, mc_paths)
+    elif kind == 'montecarlo':
+        _, mc_paths = statistics_params(request.values)
+        horizon = max(1, min(request.values.get('horizon', montecarlo.DEFAULT_HORIZON, type=int), 1000))
+        params = {'user_id': user_id, 'mc_paths': mc_paths, 'horizon': horizon}
+        version = statistics_etag(user_id, stats, 'montecarlo', mc_paths, horizon)
+    elif kind == 'export':
+        fmt = request.values.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS: abort(400)
+        params = {k: request.values[k] for k in ('pair_filter', 'outcome_filter', 'date_filter', 'tag_filter', 'user') if request.values.get(k)}
+        params['format'] = fmt
+        version = None
+    else:
+        abort(400)
+    job = submit_job(current_user.id, kind, params, cache_scope(user_id), version)
+    return jsonify(job_info(job)), 202, {'Location': url_for('job_status', job_id=job.id)}
+
+def job_info(job):
+    info = {'id': job.id, 'kind': job.kind, 'status': job.status, 'progress': job.progress, 'error': job.error,
+            'created_at': job.created_at.isoformat(), 'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+            'url': url_for('job_status', job_id=job.id)}
+    if job.status == 'done':
+        if job.kind == 'export': info['download'] = url_for('job_download', job_id=job.id)
+        else: info['result'] = json.loads(job.result)
+    return info
+
+def owned_job(job_id):
+    job = db.get_or_404(AnalyticsJob, job_id)
+    if job.user_id != current_user.id and current_user.role != 'admin': abort(404)
+    return expire_stale_job(job)
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    return jsonify(job_info(owned_job(job_id)))
+
+@app.route('/jobs/<job_id>/download')
+@login_required
+def job_download(job_id):
+    job = owned_job(job_id)
+    if job.kind != 'export' or job.status != 'done': abort(404)
+    meta = json.loads(job.result)
+    response = send_file(os.path.join(app.config['JOB_DIR'], meta['file']), mimetype=meta['mimetype'],
+                         as_attachment=True, download_name=meta['filename'], max_age=0)
+    response.headers['Cache-Control'] = 'private, no-store'   # export del diario: mai in cache condivise
+    return response
 
 @app.route('/add_trade', methods=['POST'])
 @login_required
 def add_trade():
     try:
-        sc = ",".join([l for l in [request.form.get('link1','').strip(), request.form.get('link2','').strip()] if l])
-        
-        barriers = ",".join(request.form.getlist('timeframe_barrier'))
-        aligns = ",".join(request.form.getlist('timeframe_align'))
-
-        new_entry = JournalEntry(
-            user_id=current_user.id, 
-            pair=request.form.get('pair'), 
-            date=datetime.strptime(request.form.get('date'), '%Y-%m-%d'),
-            time=request.form.get('time'), 
-            direction=request.form.get('direction'),
-            risk_percent=float(request.form.get('risk_percent') or 0), 
-            rr_final=float(request.form.get('rr_final') or 0),
-            pips_sl=float(request.form.get('pips_sl') or 0),
-            pips_tp=float(request.form.get('pips_tp') or 0),
-            outcome=request.form.get('outcome'), 
-            result_percent=float(request.form.get('result_percent') or 0),
-            timeframe=barriers, 
-            alignment=aligns,   
-            selected_pros=",".join(request.form.getlist('pros')),
-            selected_cons=",".join(request.form.getlist('cons')), 
-            screen_pre=sc, 
-            emotions=request.form.get('emotions'), 
-            notes=request.form.get('notes')
-        )
+        new_entry = JournalEntry(user_id=current_user.id, **coerce_trade(form_trade_values(request.form)))
+        set_trade_tags(new_entry)
         db.session.add(new_entry)
+        update_trade_stats(new_entry)
         db.session.commit()
+        invalidate_trade_cache(current_user.id)
         flash('Trade aggiunto!', 'success')
     except Exception as e: flash(f'Errore: {str(e)}', 'danger')
     return redirect(url_for('dashboard'))
 
+@app.route('/import_trades', methods=['POST'])
+@login_required
+def import_trades():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Nessun file selezionato.', 'danger')
+        return redirect(url_for('dashboard'))
+    try:
+        imported, errors = import_trades_csv(io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline=''), current_user.id)
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Errore: {str(e)}', 'danger')
+        return redirect(url_for('dashboard'))
+    flash(f'Importati {imported} trade.', 'success')
+    if errors:
+        detail = "; ".join(f"riga {n}: {m}" for n, m in errors[:5])
+        flash(f'{len(errors)} righe scartate ({detail}{"; ..." if len(errors) > 5 else ""})', 'danger')
+    return redirect(url_for('dashboard'))
+
+@app.route('/export')
+@login_required
+@read_replica
+def export_trades():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS: abort(400)
+    mimetype, ext = EXPORT_FORMATS[fmt]
+    rows = export_rows(export_query(current_user, request.args))
+    response = Response(stream_with_context(EXPORT_WRITERS[fmt](rows)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=journal_{datetime.now():%Y%m%d}.{ext}'
+    return response
+
 @app.route('/delete_trade/<int:id>')
 @login_required
 def delete_trade(id):
     trade = JournalEntry.query.get_or_404(id)
     if trade.user_id == current_user.id or current_user.role == 'admin':
+        update_trade_stats(trade, -1)
         db.session.delete(trade)
         db.session.commit()
+        invalidate_trade_cache(trade.user_id)
     return redirect(url_for('dashboard'))
 
 @app.route('/edit_trade/<int:id>', methods=['GET', 'POST'])
@@ -536,26 +1623,13 @@ def edit_trade(id):
     if trade.user_id != current_user.id and current_user.role != 'admin': return redirect(url_for('dashboard'))
     
     if request.method == 'POST':
-        trade.pair = request.form.get('pair')
-        trade.date = datetime.strptime(request.form.get('date'), '%Y-%m-%d')
-        trade.time = request.form.get('time')
-        trade.direction = request.form.get('direction')
-        trade.outcome = request.form.get('outcome')
-        trade.risk_percent = float(request.form.get('risk_percent') or 0)
-        trade.result_percent = float(request.form.get('result_percent') or 0)
-        trade.rr_final = float(request.form.get('rr_final') or 0)
-        trade.pips_sl = float(request.form.get('pips_sl') or 0)
-        trade.pips_tp = float(request.form.get('pips_tp') or 0)
-        trade.emotions = request.form.get('emotions')
-        trade.notes = request.form.get('notes')
-        
-        trade.timeframe = ",".join(request.form.getlist('timeframe_barrier'))
-        trade.alignment = ",".join(request.form.getlist('timeframe_align'))
-        
-        trade.selected_pros = ",".join(request.form.getlist('pros'))
-        trade.selected_cons = ",".join(request.form.getlist('cons'))
-        trade.screen_pre = ",".join([l for l in [request.form.get('link1','').strip(), request.form.get('link2','').strip()] if l])
+        update_trade_stats(trade, -1)
+        for field, value in coerce_trade(form_trade_values(request.form)).items():
+            setattr(trade, field, value)
+        set_trade_tags(trade)
+        update_trade_stats(trade)
         db.session.commit()
+        invalidate_trade_cache(trade.user_id)
         flash('Modificato!', 'success')
         return redirect(url_for('dashboard'))
     
@@ -565,9 +1639,7 @@ def edit_trade(id):
     curr_pros = trade.selected_pros.split(',') if trade.selected_pros else []
     curr_cons = trade.selected_cons.split(',') if trade.selected_cons else []
     cur_lnks = trade.screen_pre.split(',') if trade.screen_pre else []
-    u_pros = [p for p in (current_user.pros_settings.split(',') if current_user.pros_settings else []) if p]
-    u_cons = [c for c in (current_user.cons_settings.split(',') if current_user.cons_settings else []) if c]
-    custom_pairs_list = [p.strip().upper() for p in (current_user.custom_pairs.split(',') if current_user.custom_pairs else []) if p.strip()]
+    u_pros, u_cons, custom_pairs_list = user_setting_lists(current_user)
 
     return render_template('edit_trade.html', trade=trade, 
                            curr_barriers=curr_barriers, curr_aligns=curr_aligns,
@@ -575,7 +1647,35 @@ def edit_trade(id):
                            user_pros_list=u_pros, user_cons_list=u_cons, custom_pairs=custom_pairs_list,
                            val_link1=cur_lnks[0] if len(cur_lnks)>0 else '', val_link2=cur_lnks[1] if len(cur_lnks)>1 else '')
 
-with app.app_context(): db.create_all()
+# --- SCHEMA & MIGRAZIONI ---
+# Lo schema si crea / aggiorna con `flask migrate` (fase di release), non all'import: all'avvio
+# solo una SELECT sulla versione. Poi il pool viene svuotato, così i worker di gunicorn --preload
+# nascono senza connessioni ereditate dal master.
+def init_db(log=click.echo):
+    return migrations.upgrade(db.engine, db.metadata.create_all, log)
+
+@app.cli.command('migrate')
+def migrate_command():
+    version = init_db()
+    # aggregati mancanti (database precedenti agli aggregati): ricostruiti per quegli utenti
+    missing = (db.session.query(JournalEntry.user_id).distinct()
+               .filter(~db.exists().where(TradeStat.user_id == JournalEntry.user_id, TradeStat.bucket == 'all')).all())
+    for (user_id,) in missing:
+        rebuild_trade_stats(user_id)
+    if missing: click.echo(f'Aggregati ricostruiti per {len(missing)} utenti.')
+    click.echo(f'Schema alla versione {version}.')
+
+def check_schema_version():
+    with app.app_context():
+        with db.engine.connect() as conn:
+            version = migrations.current_version(conn)
+        db.engine.dispose()
+    if version != migrations.head():
+        app.logger.warning('Schema del database alla versione %s, attesa %s: eseguire `flask migrate`.', version, migrations.head())
+
 if __name__ == '__main__':
+    with app.app_context(): init_db()   # in sviluppo lo schema si aggiorna all'avvio
     port = int(os.environ.get("PORT", 5001))
-    app.run(host="0.0.0.0", port=port)
\ No newline at end of file
+    app.run(host="0.0.0.0", port=port)
+elif os.environ.get('FLASK_RUN_FROM_CLI') != 'true':
+    check_schema_version()
\ No newline at end of file
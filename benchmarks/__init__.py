@@ -0,0 +1 @@
+# Benchmark riproducibili: generatore di journal sintetici (generator) e scenari HTTP (run).
@@ -0,0 +1,61 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Avvio a freddo: tempo di `import app` (quello che paga ogni worker gunicorn senza --preload)
+# e query eseguite durante l'import, su un database già creato e popolato.
+#   python -m benchmarks.cold_start --repeat 10 --out cold_start.json
+
+CHILD = """
+import time
+start = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+queries = []
+event.listen(Engine, 'before_cursor_execute', lambda *args: queries.append(1))
+import app
+print(time.perf_counter() - start, len(queries))
+"""
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(prog='python -m benchmarks.cold_start')
+    p.add_argument('--repeat', type=int, default=10, help='processi avviati')
+    p.add_argument('--trades', type=int, default=1000)
+    p.add_argument('--database-url', help='default: SQLite in una cartella temporanea')
+    p.add_argument('--out', default='cold_start.json')
+    return p.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tmpdir = tempfile.TemporaryDirectory(prefix='journal-cold-')
+    env = dict(os.environ, DATABASE_URL=args.database_url or f"sqlite:///{os.path.join(tmpdir.name, 'cold.db')}")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    prepare = ("import app; from benchmarks.generator import populate\n"
+               f"with app.app.app_context(): app.init_db(); populate(app, 2, {args.trades // 2})")
+    subprocess.run([sys.executable, '-c', prepare], env=env, cwd=root, check=True, capture_output=True)
+
+    samples, queries = [], set()
+    for _ in range(args.repeat):
+        out = subprocess.run([sys.executable, '-c', CHILD], env=env, cwd=root, check=True, capture_output=True, text=True)
+        seconds, count = out.stdout.split()
+        samples.append(float(seconds))
+        queries.add(int(count))
+    tmpdir.cleanup()
+
+    samples.sort()
+    report = {'repeat': args.repeat, 'min_ms': round(samples[0] * 1000, 1),
+              'p50_ms': round(samples[len(samples) // 2] * 1000, 1), 'max_ms': round(samples[-1] * 1000, 1),
+              'queries': sorted(queries)}
+    print(f"import app: min {report['min_ms']} ms  p50 {report['p50_ms']} ms  max {report['max_ms']} ms  "
+          f"query all'import {report['queries']}")
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import random
+from datetime import date, timedelta
+
+# Generatore deterministico di journal sintetici: stesso seed -> stessi utenti e trade.
+# Valori e confluenze vengono dalle liste del form e dai default del modello User.
+
+PAIRS = (('EURUSD', 18), ('GBPUSD', 12), ('USDJPY', 8), ('USDCAD', 4), ('AUDUSD', 4), ('EURGBP', 3),
+         ('GBPJPY', 5), ('EURJPY', 3), ('AUDJPY', 2), ('CADJPY', 1), ('XAUUSD', 15), ('XAGUSD', 2),
+         ('WTI', 2), ('US30', 5), ('NAS100', 8), ('SPX500', 3), ('DAX40', 3), ('UK100', 1),
+         ('BTCUSD', 3), ('ETHUSD', 2), ('SOLUSD', 1))
+OUTCOMES = (('Target', 40), ('Stop Loss', 42), ('Breakeven', 10), ('Non Fillato', 5), ('Setup', 3))
+BARRIERS = ('m1', 'm3', 'm5', 'm15', 'm30')
+ALIGNMENTS = ('h1', 'h4', 'D1', 'W', 'M')
+EMOTIONS = ('ansia', 'stress', 'paura', 'fretta', 'tranquillo', 'sicuro', 'calmo', '')
+SESSIONS = ('08', '09', '10', '14', '15', '16')
+
+
+def model_defaults(User):
+    pros = User.pros_settings.default.arg.split(',')
+    cons = User.cons_settings.default.arg.split(',')
+    return pros, cons
+
+
+def weighted(rng, table):
+    values, weights = zip(*table)
+    return rng.choices(values, weights)[0]
+
+
+def trade_rows(rng, n, pros, cons, start=date(2023, 1, 2)):
+    # Trade di un utente in ordine di data, solo giorni feriali, 0-4 per giorno
+    day = start
+    rows = []
+    while len(rows) < n:
+        if day.weekday() < 5:
+            for _ in range(min(rng.choice((0, 1, 1, 2, 2, 3, 4)), n - len(rows))):
+                outcome = weighted(rng, OUTCOMES)
+                risk = rng.choice((0.5, 0.5, 1.0, 1.0, 1.0, 2.0))
+                rr = round(rng.uniform(1.0, 4.0), 1)
+                result = {'Target': risk * rr, 'Stop Loss': -risk, 'Breakeven': 0.0}.get(outcome, 0.0)
+                rows.append({
+                    'pair': weighted(rng, PAIRS), 'date': day,
+                    'time': f"{rng.choice(SESSIONS)}:{rng.randrange(0, 60, 5):02d}",
+                    'direction': rng.choice(('Long', 'Short')), 'outcome': outcome,
+                    'risk_percent': risk, 'rr_final': rr if outcome == 'Target' else 0.0,
+                    'pips_sl': float(rng.randint(5, 40)), 'pips_tp': float(rng.randint(10, 120)),
+                    'result_percent': round(result, 2),
+                    'timeframe': ",".join(sorted(rng.sample(BARRIERS, rng.randint(1, 2)), key=BARRIERS.index)),
+                    'alignment': ",".join(sorted(rng.sample(ALIGNMENTS, rng.randint(1, 3)), key=ALIGNMENTS.index)),
+                    'selected_pros': ",".join(rng.sample(pros, rng.randint(0, len(pros)))),
+                    'selected_cons': ",".join(rng.sample(cons, rng.choice((0, 0, 0, 1)))),
+                    'screen_pre': f"https://www.tradingview.com/x/{rng.getrandbits(32):08x}/" if rng.random() < 0.3 else '',
+                    'emotions': rng.choice(EMOTIONS), 'notes': '',
+                })
+        day += timedelta(days=1)
+    return rows
+
+
+def populate(app_module, n_users, trades_per_user, seed=0, password='bench', batch_size=5000, rounds=4):
+    # Crea n_users studenti (più un admin senza trade) e i loro trade. Passa per
+    # insert_trade_batch, quindi tag e aggregati sono coerenti come dopo un import.
+    # Ritorna {username: user_id}.
+    m = app_module
+    rng = random.Random(seed)
+    pros, cons = model_defaults(m.User)
+    pw_hash = m.bcrypt.generate_password_hash(password, rounds=rounds).decode('utf-8')
+    users = [m.User(username=m.ADMIN_USER, password=pw_hash, role='admin')]
+    users += [m.User(username=f"student{i:03d}", password=pw_hash, role='student') for i in range(n_users)]
+    m.db.session.add_all(users)
+    m.db.session.commit()
+    for user in users[1:]:
+        rows = trade_rows(rng, trades_per_user, pros, cons)
+        for i in range(0, len(rows), batch_size):
+            m.insert_trade_batch(user.id, rows[i:i + batch_size])
+    return {u.username: u.id for u in users}
@@ -0,0 +1,138 @@
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Prova di carico: latenza della dashboard mentre altri client tempestano /login con
+# password sbagliate. Il server serve al più --threads richieste insieme, come un worker
+# gunicorn gthread (Procfile); con --threads 1 è un worker sync, dove ogni hash bcrypt
+# calcolato per un attaccante è tempo tolto alla dashboard.
+#   python -m benchmarks.login_storm                # con limite (config di default)
+#   python -m benchmarks.login_storm --no-limit     # senza limite, per confronto
+#   python -m benchmarks.login_storm --threads 1    # worker sync
+
+PASSWORD = 'bench'
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(prog='python -m benchmarks.login_storm')
+    p.add_argument('--rounds', type=int, default=12, help='costo bcrypt delle password')
+    p.add_argument('--trades', type=int, default=2000)
+    p.add_argument('--storm-threads', type=int, default=8)
+    p.add_argument('--requests', type=int, default=40, help='richieste dashboard misurate per fase')
+    p.add_argument('--no-limit', action='store_true', help='disattiva il token bucket sui login')
+    p.add_argument('--threads', type=int, default=8, help='richieste servite insieme (1 = worker sync)')
+    p.add_argument('--out', default='login_storm.json')
+    return p.parse_args(argv)
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def post(opener, url, data):
+    try:
+        with opener.open(url, urllib.parse.urlencode(data).encode(), timeout=60) as r:
+            return r.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def dashboard_latencies(opener, base, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        with opener.open(base + '/dashboard', timeout=60) as r:
+            r.read()
+        samples.append(time.perf_counter() - start)
+    return {'p50_ms': round(percentile(samples, 0.5) * 1000, 2), 'p95_ms': round(percentile(samples, 0.95) * 1000, 2)}
+
+
+def pool_server(host, port, wsgi_app, threads):
+    # Server werkzeug con un pool fisso di thread, come gunicorn --worker-class gthread
+    from werkzeug.serving import BaseWSGIServer
+
+    class Server(BaseWSGIServer):
+        pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+
+        def process_request(self, request, client_address):
+            self.pool.submit(self.handle_in_thread, request, client_address)
+
+        def handle_in_thread(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    return Server(host, port, wsgi_app)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tmpdir = tempfile.TemporaryDirectory(prefix='journal-storm-')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir.name, 'storm.db')}"
+    os.environ['BCRYPT_LOG_ROUNDS'] = str(args.rounds)
+    if args.no_limit:
+        os.environ['LOGIN_RATE_PER_MIN'] = '0'
+
+    from werkzeug.serving import make_server
+    import app as journal
+    from benchmarks.generator import populate
+    with journal.app.app_context():
+        journal.db.create_all()
+        populate(journal, 2, args.trades // 2, password=PASSWORD, rounds=args.rounds)
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)   # niente log per richiesta
+    if args.threads > 1:
+        server = pool_server('127.0.0.1', 0, journal.app, threads=args.threads)
+    else:
+        server = make_server('127.0.0.1', 0, journal.app, threaded=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    if post(opener, base + '/login', {'username': 'student000', 'password': PASSWORD}) != 200:
+        raise RuntimeError('login del client dashboard fallito')
+
+    report = {'rounds': args.rounds, 'limit': not args.no_limit, 'threads': args.threads,
+              'storm_threads': args.storm_threads}
+    report['quiet'] = dashboard_latencies(opener, base, args.requests)
+
+    stop, statuses, lock = threading.Event(), Counter(), threading.Lock()
+    def attacker(i):
+        client = urllib.request.build_opener()
+        while not stop.is_set():
+            status = post(client, base + '/login', {'username': f'student00{i % 2}', 'password': 'sbagliata'})
+            with lock: statuses[status] += 1
+    threads = [threading.Thread(target=attacker, args=(i,), daemon=True) for i in range(args.storm_threads)]
+    for t in threads: t.start()
+    time.sleep(0.5)
+    report['storm'] = dashboard_latencies(opener, base, args.requests)
+    stop.set()
+    for t in threads: t.join()
+    server.shutdown()
+    report['storm_responses'] = {str(k): v for k, v in sorted(statuses.items())}
+    tmpdir.cleanup()
+
+    for phase in ('quiet', 'storm'):
+        print(f"{phase:6s} dashboard p50 {report[phase]['p50_ms']:8.2f} ms  p95 {report[phase]['p95_ms']:8.2f} ms")
+    print(f"risposte ai login dell'attacco: {report['storm_responses']}")
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from sqlalchemy import inspect as sa_inspect
+
+# Benchmark delle route principali tramite il test client di Flask.
+#   python -m benchmarks.run --sizes 1000,10000 --out bench.json
+#   python -m benchmarks.run --sizes 1000 --compare bench.json
+# --sizes è il numero totale di trade, divisi tra --users studenti.
+
+PASSWORD = 'bench'
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(prog='python -m benchmarks.run')
+    p.add_argument('--sizes', default='1000,10000', help='trade totali per scenario, separati da virgola (es. 1000,10000,100000,1000000)')
+    p.add_argument('--users', type=int, default=4, help='studenti su cui dividere i trade')
+    p.add_argument('--repeat', type=int, default=20, help='richieste misurate per scenario')
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--database-url', help='default: SQLite in una cartella temporanea')
+    p.add_argument('--out', default='bench_results.json')
+    p.add_argument('--compare', help='file JSON di un run precedente da confrontare')
+    return p.parse_args(argv)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+class LoadedBytes:
+    # Dimensione approssimativa dei valori di colonna caricati negli oggetti ORM (testo in
+    # UTF-8, altri valori come stringa): misura quanto pesano le righe lette per richiesta
+    def __init__(self):
+        self.total = 0
+
+    def __call__(self, session, instance):
+        state = sa_inspect(instance)
+        for attr in state.mapper.column_attrs:
+            value = state.dict.get(attr.key)
+            if value is not None:
+                self.total += len(value.encode() if isinstance(value, str) else str(value))
+
+
+def login(app_module, username):
+    client = app_module.app.test_client()
+    r = client.post('/login', data={'username': username, 'password': PASSWORD})
+    if r.status_code != 302:
+        raise RuntimeError(f"login fallito per {username}")
+    return client
+
+
+def trade_form(day):
+    return {'pair': 'EURUSD', 'date': day.isoformat(), 'time': '09:30', 'direction': 'Long', 'outcome': 'Target',
+            'risk_percent': '1', 'rr_final': '2.5', 'pips_sl': '12', 'pips_tp': '30', 'result_percent': '2.5',
+            'timeframe_barrier': ['m5', 'm15'], 'timeframe_align': ['h4'], 'pros': ['Trendline'], 'cons': [],
+            'link1': '', 'link2': '', 'emotions': 'calmo', 'notes': 'bench'}
+
+
+def scenarios(m, users):
+    student = login(m, 'student000')
+    admin = login(m, m.ADMIN_USER)
+    with m.app.app_context():
+        first = m.JournalEntry.query.filter_by(user_id=users['student000']).order_by(m.JournalEntry.date).first()
+        edit_id = m.JournalEntry.query.filter_by(user_id=users['student000']).order_by(m.JournalEntry.id.desc()).first().id
+    month = first.date.strftime('%Y-%m')
+    filters = f"?pair_filter=EURUSD&outcome_filter=Target&date_filter={month}"
+    form = trade_form(first.date)
+    return {
+        'dashboard_student': lambda: student.get('/dashboard'),
+        'dashboard_student_filtered': lambda: student.get('/dashboard' + filters),
+        'dashboard_student_keyset': lambda: student.get('/dashboard?pagination=keyset'),
+        'dashboard_admin': lambda: admin.get('/dashboard'),
+        'dashboard_admin_filtered': lambda: admin.get('/dashboard' + filters),
+        'statistics_student': lambda: student.get('/statistics'),
+        'statistics_admin': lambda: admin.get('/statistics'),
+        'add_trade': lambda: student.post('/add_trade', data=form),
+        'edit_trade': lambda: student.post(f'/edit_trade/{edit_id}', data=form),
+    }
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def measure(request, counter, loaded, repeat):
+    # Prima richiesta a freddo separata; poi latenze a caldo; infine una richiesta
+    # sotto tracemalloc per il picco di memoria (tracemalloc rallenta, non entra nelle latenze)
+    # e per i byte caricati dall'ORM a cache calda
+    counter.count = 0
+    start = time.perf_counter()
+    r = request()
+    cold = time.perf_counter() - start
+    if r.status_code >= 400:
+        raise RuntimeError(f"HTTP {r.status_code}")
+    queries = counter.count
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        request()
+        samples.append(time.perf_counter() - start)
+    loaded.total = 0
+    tracemalloc.start()
+    request()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'cold_ms': round(cold * 1000, 2), 'p50_ms': round(percentile(samples, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(samples, 0.95) * 1000, 2), 'queries': queries,
+            'peak_kb': round(peak / 1024, 1), 'orm_bytes': loaded.total}
+
+
+def run_size(m, counter, loaded, size, args):
+    from benchmarks.generator import populate
+    with m.app.app_context():
+        m.db.drop_all()
+        m.db.create_all()
+        m.cached_calendar.cache_clear()
+        m.montecarlo.simulate_max_drawdowns.cache_clear()
+        start = time.perf_counter()
+        users = populate(m, args.users, size // args.users, seed=args.seed, password=PASSWORD)
+        seeded = time.perf_counter() - start
+    print(f"[{size}] dati generati in {seeded:.1f}s", flush=True)
+    results = {}
+    for name, request in scenarios(m, users).items():
+        results[name] = measure(request, counter, loaded, args.repeat)
+        r = results[name]
+        print(f"[{size}] {name:28s} p50 {r['p50_ms']:9.2f} ms  p95 {r['p95_ms']:9.2f} ms  "
+              f"{r['queries']:3d} query  {r['peak_kb']:10.1f} KB  {r['orm_bytes']:8d} B ORM", flush=True)
+    return {'seed_s': round(seeded, 2), 'scenarios': results}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous):
+    print(f"\nConfronto con {previous['meta'].get('revision')} ({previous['meta'].get('timestamp')}): p50 attuale / precedente")
+    for size, data in current['results'].items():
+        old = previous['results'].get(size)
+        if not old: continue
+        for name, r in data['scenarios'].items():
+            prev = old['scenarios'].get(name)
+            if not prev or not prev['p50_ms']: continue
+            print(f"[{size}] {name:28s} {r['p50_ms']:9.2f} / {prev['p50_ms']:9.2f} ms  x{r['p50_ms'] / prev['p50_ms']:.2f}"
+                  f"  query {prev['queries']} -> {r['queries']}"
+                  f"  B ORM {prev.get('orm_bytes', '-')} -> {r['orm_bytes']}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    tmpdir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmpdir = tempfile.TemporaryDirectory(prefix='journal-bench-')
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmpdir.name, 'bench.db')}"
+
+    # le statistiche si misurano calcolate nella richiesta, non dallo snapshot dei job;
+    # login dei client senza limite e con lo stesso costo bcrypt degli utenti generati
+    os.environ.setdefault('STATS_ASYNC_MIN_TRADES', str(2 ** 62))
+    os.environ.setdefault('LOGIN_RATE_PER_MIN', '0')
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '4')
+    import app as journal
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from sqlalchemy.orm import Session
+    counter, loaded = QueryCounter(), LoadedBytes()
+    event.listen(Engine, 'before_cursor_execute', counter)
+    event.listen(Session, 'loaded_as_persistent', loaded)
+
+    with journal.app.app_context():
+        backend = journal.db.engine.url.get_backend_name()
+    report = {'meta': {'timestamp': datetime.now().isoformat(timespec='seconds'), 'revision': git_revision(),
+                       'python': platform.python_version(), 'platform': platform.platform(), 'database': backend,
+                       'users': args.users, 'repeat': args.repeat, 'seed': args.seed},
+              'results': {}}
+    try:
+        for size in sizes:
+            report['results'][str(size)] = run_size(journal, counter, loaded, size, args)
+    finally:
+        if tmpdir is not None: tmpdir.cleanup()
+
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nRisultati in {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
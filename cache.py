@@ -0,0 +1,154 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Cache dei risultati a due livelli: LRU con TTL nel processo (sempre) + livello condiviso
+# opzionale con interfaccia Redis (get / set ex= / incr / delete), comune a tutti i worker.
+# Le chiavi includono la generazione dello scope: bump() la incrementa e rende
+# irraggiungibili tutte le voci precedenti, che poi escono per LRU / TTL.
+# I valori del livello condiviso sono JSON: solo dict / liste / numeri / stringhe.
+
+
+class LocalCache:
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = OrderedDict()   # chiave -> (scadenza, valore)
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+class FakeRedis:
+    # Sottoinsieme di redis.Redis in memoria, per sviluppo e prove senza server (CACHE_URL=fake://)
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}   # chiave -> (scadenza o None, bytes)
+
+    def _live(self, key):
+        item = self.data.get(key)
+        if item is not None and item[0] is not None and item[0] < time.monotonic():
+            del self.data[key]
+            return None
+        return item
+
+    def get(self, name):
+        with self.lock:
+            item = self._live(name)
+            return item[1] if item else None
+
+    def set(self, name, value, ex=None):
+        if isinstance(value, str): value = value.encode()
+        elif isinstance(value, int): value = str(value).encode()
+        with self.lock:
+            self.data[name] = (time.monotonic() + ex if ex else None, value)
+        return True
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            item = self._live(name)
+            value = int(item[1]) + amount if item else amount
+            self.data[name] = (item[0] if item else None, str(value).encode())
+            return value
+
+    def delete(self, *names):
+        with self.lock:
+            return sum(self.data.pop(n, None) is not None for n in names)
+
+    def flushdb(self):
+        with self.lock:
+            self.data.clear()
+
+
+class ResultCache:
+    def __init__(self, local, shared=None, prefix='journal:', ttl=300):
+        self.local = local
+        self.shared = shared
+        self.prefix = prefix
+        self.ttl = ttl
+        self.generations = {}   # solo senza livello condiviso (fuori dall'LRU: mai espulse)
+        self.lock = threading.Lock()
+
+    def generation(self, scope):
+        if self.shared is not None:
+            value = self.shared.get(f"{self.prefix}gen:{scope}")
+            return int(value) if value is not None else 0
+        return self.generations.get(scope, 0)
+
+    def bump(self, *scopes):
+        for scope in scopes:
+            if self.shared is not None:
+                self.shared.incr(f"{self.prefix}gen:{scope}")
+            else:
+                with self.lock:
+                    self.generations[scope] = self.generations.get(scope, 0) + 1
+
+    def key(self, scope, params):
+        # params: stringa con versione dei dati e parametri della richiesta
+        return f"{self.prefix}{scope}:{self.generation(scope)}:{params}"
+
+    def get(self, scope, params, ttl=None):
+        key = self.key(scope, params)
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            raw = self.shared.get(key)
+            if raw is not None:
+                value = json.loads(raw)
+                self.local.set(key, value, ttl or self.ttl)
+        return value
+
+    def set(self, scope, params, value, ttl=None):
+        key = self.key(scope, params)
+        self.local.set(key, value, ttl or self.ttl)
+        if self.shared is not None:
+            self.shared.set(key, json.dumps(value), ex=ttl or self.ttl)
+
+    def get_or_set(self, scope, params, build, ttl=None):
+        value = self.get(scope, params, ttl)
+        if value is None:
+            value = build()
+            if value is not None:
+                self.set(scope, params, value, ttl)
+        return value
+
+    def clear(self):
+        self.local.clear()
+
+
+def from_url(url=None, maxsize=256, ttl=300):
+    # None / '' -> solo LRU locale; fake:// -> FakeRedis; redis:// o rediss:// -> redis-py
+    shared = None
+    if url and url.startswith('fake://'):
+        shared = FakeRedis()
+    elif url:
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_URL richiede il pacchetto 'redis' (pip install redis)")
+        shared = redis.Redis.from_url(url)
+    return ResultCache(LocalCache(maxsize, ttl), shared, ttl=ttl)
@@ -0,0 +1,84 @@
+from datetime import date
+import numpy as np
+
+# Equity curve: P/L per trade o aggregato per giorno / settimana / mese, drawdown
+# calcolato sugli stessi array e riduzione a un numero massimo di punti con LTTB
+# (Largest-Triangle-Three-Buckets: conserva picchi e minimi della curva).
+
+RESOLUTIONS = ('trade', 'day', 'week', 'month')
+DEFAULT_MAX_POINTS = 500
+LABEL_FORMATS = {'trade': '%d/%m', 'day': '%d/%m/%y', 'week': '%d/%m/%y', 'month': '%m/%Y'}
+
+
+def bucket_start(date_ord, resolution):
+    # Ordinale del primo giorno del bucket (lunedì per le settimane, giorno 1 per i mesi)
+    if resolution == 'day':
+        return date_ord
+    if resolution == 'week':
+        return date_ord - (date_ord - 1) % 7   # date.fromordinal(1) è un lunedì
+    days, inverse = np.unique(date_ord, return_inverse=True)
+    firsts = np.fromiter((date.fromordinal(int(d)).replace(day=1).toordinal() for d in days), dtype=np.int64, count=len(days))
+    return firsts[inverse]
+
+
+def resample(date_ord, pl, resolution):
+    # date_ord ordinato: ritorna (inizio bucket, P/L del bucket)
+    date_ord = np.asarray(date_ord, dtype=np.int64)
+    pl = np.asarray(pl, dtype=np.float64)
+    if resolution == 'trade' or not len(date_ord):
+        return date_ord, pl
+    keys, inverse = np.unique(bucket_start(date_ord, resolution), return_inverse=True)
+    return keys, np.bincount(inverse, weights=pl, minlength=len(keys))
+
+
+def drawdown(date_ord, curve):
+    # Picco con partenza da 0 (come le simulazioni Monte Carlo); durata = tratto più lungo
+    # sott'acqua, dal giorno del picco al recupero (o all'ultimo punto)
+    if not len(curve):
+        return {'max_drawdown': 0, 'max_dd_days': 0, 'max_dd_points': 0}
+    peak = np.maximum(np.maximum.accumulate(curve), 0)
+    dd = peak - curve
+    under = np.concatenate(([False], dd > 1e-9, [False]))
+    edges = np.flatnonzero(np.diff(under.astype(np.int8)))
+    starts, ends = edges[0::2], edges[1::2]   # [start, end) dei tratti sott'acqua
+    days, points = 0, 0
+    if len(starts):
+        peak_day = np.where(starts > 0, date_ord[np.maximum(starts - 1, 0)], date_ord[starts])
+        end_day = date_ord[np.minimum(ends, len(curve) - 1)]
+        spans = end_day - peak_day
+        j = int(np.argmax(spans))
+        days, points = int(spans[j]), int(ends[j] - starts[j])
+    return {'max_drawdown': round(float(dd.max()), 2), 'max_dd_days': days, 'max_dd_points': points}
+
+
+def lttb(y, n_out):
+    # Indici dei punti scelti; x = posizione (l'asse del grafico è per indice)
+    n = len(y)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:   # niente bucket interni: solo gli estremi
+        return np.array([0, n - 1][:max(n_out, 1)], dtype=np.int64)
+    x = np.arange(n, dtype=np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)   # bucket interni [edges[i], edges[i+1])
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        cx, cy = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def equity_curve(date_ord, pl, resolution='trade', max_points=DEFAULT_MAX_POINTS):
+    keys, pl = resample(date_ord, pl, resolution)
+    curve = np.cumsum(pl)
+    stats = drawdown(keys, curve)
+    index = lttb(curve, max_points) if max_points else np.arange(len(curve))
+    fmt = LABEL_FORMATS[resolution]
+    return dict(labels=[date.fromordinal(o).strftime(fmt) for o in keys[index].tolist()],
+                data=[round(v, 2) for v in curve[index].tolist()],
+                index=index, points=len(curve), resolution=resolution, **stats)
@@ -0,0 +1,162 @@
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# Strumentazione per richiesta: tempo totale, numero e tempo delle query SQL,
+# oggetti ORM idratati e span nominati sui blocchi principali delle view.
+# I contatori sono per processo (ogni worker gunicorn ha i suoi).
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}    # (nome, etichette) -> valore
+        self.histograms = {}  # (nome, etichette) -> [conteggi per bucket, somma, numero]
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, labels)
+        with self.lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [[0] * len(DURATION_BUCKETS), 0.0, 0]
+            for i, le in enumerate(DURATION_BUCKETS):
+                if value <= le: h[0][i] += 1
+            h[1] += value
+            h[2] += 1
+
+    # Formato testo di Prometheus (exposition format 0.0.4)
+    def render(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((k, (list(b), s, n)) for k, (b, s, n) in self.histograms.items())
+        lines, typed = [], set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter"); typed.add(name)
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), (buckets, total, count) in histograms:
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram"); typed.add(name)
+            for le, c in zip(DURATION_BUCKETS, buckets):
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', str(le)),))} {c}")
+            lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {total}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    if not labels: return ""
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in labels) + "}"
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+metrics = MetricsRegistry()
+
+# Un solo cProfile attivo per processo: da Python 3.12 un secondo enable() concorrente (worker
+# gthread) solleva ValueError. Le richieste che non ottengono il lock non vengono profilate
+profiler_lock = threading.Lock()
+
+
+def current_perf():
+    return g.get('_perf') if has_request_context() else None
+
+
+@contextmanager
+def span(name):
+    # Tempo di un blocco nominato; fuori da una richiesta non registra nulla
+    perf = current_perf()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if perf is not None:
+            perf['spans'][name] = perf['spans'].get(name, 0) + time.perf_counter() - start
+
+
+# --- EVENTI SQLALCHEMY (su tutti gli engine e tutte le sessioni) ---
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_perf_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['_perf_start'].pop()
+    perf = current_perf()
+    if perf is not None:
+        perf['sql_count'] += 1
+        perf['sql_time'] += time.perf_counter() - start
+
+
+@event.listens_for(Session, 'loaded_as_persistent')
+def _loaded_as_persistent(session, instance):
+    perf = current_perf()
+    if perf is not None:
+        perf['rows'] += 1
+
+
+def init_app(app):
+    # PROFILE_SLOW_MS: se impostato, ogni richiesta gira sotto cProfile e quelle più lente
+    # della soglia vengono salvate come file pstats in PROFILE_DIR
+    app.config.setdefault('PROFILE_SLOW_MS', None)
+    app.config.setdefault('PROFILE_DIR', 'profiles')
+
+    @app.before_request
+    def start_request_metrics():
+        g._perf = {'start': time.perf_counter(), 'sql_count': 0, 'sql_time': 0.0, 'rows': 0, 'spans': {}}
+        if app.config['PROFILE_SLOW_MS'] is not None and profiler_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:   # un altro strumento di profiling è già attivo
+                profiler_lock.release()
+            else:
+                g._profiler = profiler
+
+    @app.after_request
+    def record_status(response):
+        perf = g.get('_perf')
+        if perf is not None: perf['status'] = response.status_code
+        return response
+
+    # Chiusura a fine richiesta; per le risposte in streaming (export) il tempo misurato
+    # arriva fino all'inizio dello stream
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        perf = g.pop('_perf', None)
+        profiler = g.pop('_profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            profiler_lock.release()
+        if perf is None: return
+        elapsed = time.perf_counter() - perf['start']
+        endpoint = request.endpoint or 'unknown'
+        labels = (('endpoint', endpoint),)
+        metrics.observe('http_request_duration_seconds', labels, elapsed)
+        metrics.inc('http_requests_total', labels + (('method', request.method), ('status', str(perf.get('status', 500)))))
+        metrics.inc('db_statements_total', labels, perf['sql_count'])
+        metrics.inc('db_statement_seconds_total', labels, perf['sql_time'])
+        metrics.inc('orm_rows_hydrated_total', labels, perf['rows'])
+        for name, seconds in perf['spans'].items():
+            metrics.observe('span_duration_seconds', labels + (('span', name),), seconds)
+        if profiler is not None and elapsed * 1000 >= app.config['PROFILE_SLOW_MS']:
+            os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+            filename = f"{endpoint}-{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed * 1000)}ms.pstats"
+            profiler.dump_stats(os.path.join(app.config['PROFILE_DIR'], filename))
@@ -0,0 +1,67 @@
+import sqlalchemy as sa
+
+# Tabelle aggiunte al database originale (solo user e journal_entry): tag normalizzati,
+# aggregati delle statistiche e job in background. I tag dei trade esistenti vengono
+# ricavati dalle colonne CSV; gli aggregati si ricostruiscono da `flask migrate`.
+
+TAG_SOURCES = {'timeframe': 'timeframe', 'alignment': 'alignment', 'pro': 'selected_pros',
+               'con': 'selected_cons', 'screen': 'screen_pre'}
+
+metadata = sa.MetaData()
+journal_entry = sa.Table('journal_entry', metadata, sa.Column('id', sa.Integer, primary_key=True),
+                         sa.Column('user_id', sa.Integer), *[sa.Column(c, sa.Text) for c in TAG_SOURCES.values()])
+user = sa.Table('user', metadata, sa.Column('id', sa.Integer, primary_key=True))
+trade_tag = sa.Table(
+    'trade_tag', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('trade_id', sa.Integer, sa.ForeignKey('journal_entry.id', ondelete='CASCADE'), nullable=False),
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), nullable=False),
+    sa.Column('kind', sa.String(20), nullable=False),
+    sa.Column('value', sa.Text, nullable=False),
+)
+trade_stat = sa.Table(
+    'trade_stat', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), nullable=False),
+    sa.Column('bucket', sa.String(30), nullable=False),
+    *[sa.Column(c, sa.Integer, default=0) for c in ('n', 'active', 'wins', 'losses', 'win_rr_n')],
+    *[sa.Column(c, sa.Float, default=0) for c in ('pl', 'active_pl', 'active_pl_sq', 'win_pl', 'loss_pl', 'win_rr_sum')],
+    sa.UniqueConstraint('user_id', 'bucket'),
+)
+analytics_job = sa.Table(
+    'analytics_job', metadata,
+    sa.Column('id', sa.String(32), primary_key=True),
+    sa.Column('user_id', sa.Integer, sa.ForeignKey('user.id'), nullable=False),
+    sa.Column('kind', sa.String(20), nullable=False),
+    sa.Column('scope', sa.String(20)),
+    sa.Column('version', sa.String(64)),
+    sa.Column('params', sa.Text, default='{}'),
+    sa.Column('status', sa.String(10), default='queued'),
+    sa.Column('progress', sa.Integer, default=0),
+    sa.Column('result', sa.Text),
+    sa.Column('error', sa.Text),
+    sa.Column('created_at', sa.DateTime),
+    sa.Column('finished_at', sa.DateTime),
+)
+
+
+def split_tags(raw):
+    return [v.strip() for v in raw.split(',') if v.strip()] if raw else []
+
+
+def upgrade(conn, batch_size=5000):
+    inspector = sa.inspect(conn)
+    new_tags = not inspector.has_table('trade_tag')
+    for table in (trade_tag, trade_stat, analytics_job):
+        table.create(conn, checkfirst=True)
+    if not new_tags:
+        return
+    batch = []
+    for row in conn.execute(sa.select(journal_entry)).yield_per(batch_size):
+        for kind, raw in zip(TAG_SOURCES, row[2:]):
+            batch.extend({'trade_id': row.id, 'user_id': row.user_id, 'kind': kind, 'value': v} for v in split_tags(raw))
+        if len(batch) >= batch_size:
+            conn.execute(trade_tag.insert(), batch)
+            batch = []
+    if batch:
+        conn.execute(trade_tag.insert(), batch)
@@ -0,0 +1,9 @@
+import sqlalchemy as sa
+from migrations import has_column
+
+# Versione degli aggregati (chiave delle cache e degli ETag), +1 ad ogni scrittura
+
+
+def upgrade(conn):
+    if not has_column(conn, 'trade_stat', 'rev'):
+        conn.execute(sa.text('ALTER TABLE trade_stat ADD COLUMN rev INTEGER DEFAULT 0'))
@@ -0,0 +1,20 @@
+from migrations import create_index
+
+# Indici dei filtri di dashboard / statistiche, delle chiavi esterne e dei job:
+# create_all non li aggiunge a tabelle già esistenti
+
+INDEXES = (
+    ('journal_entry', 'ix_journal_entry_user_date', 'user_id', 'date'),
+    ('journal_entry', 'ix_journal_entry_user_pair_date', 'user_id', 'pair', 'date'),
+    ('journal_entry', 'ix_journal_entry_user_outcome', 'user_id', 'outcome'),
+    ('trade_tag', 'ix_trade_tag_trade_id', 'trade_id'),
+    ('trade_tag', 'ix_trade_tag_user_kind_value', 'user_id', 'kind', 'value'),
+    ('trade_stat', 'ix_trade_stat_user_id', 'user_id'),
+    ('analytics_job', 'ix_analytics_job_user_id', 'user_id'),
+    ('analytics_job', 'ix_analytics_job_kind_scope', 'kind', 'scope', 'created_at'),
+)
+
+
+def upgrade(conn):
+    for table, name, *columns in INDEXES:
+        create_index(conn, table, name, *columns)
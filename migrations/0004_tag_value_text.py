@@ -0,0 +1,13 @@
+import sqlalchemy as sa
+
+# trade_tag.value era VARCHAR(150), ma le colonne di origine (link degli screenshot, pro / contro
+# personalizzati) sono Text: su PostgreSQL un valore più lungo faceva fallire il salvataggio.
+# SQLite non applica la lunghezza e non va toccato.
+
+
+def upgrade(conn):
+    if conn.dialect.name != 'postgresql':
+        return
+    column = next(c for c in sa.inspect(conn).get_columns('trade_tag') if c['name'] == 'value')
+    if not isinstance(column['type'], sa.Text):
+        conn.execute(sa.text('ALTER TABLE trade_tag ALTER COLUMN value TYPE TEXT'))
@@ -0,0 +1,10 @@
+import sqlalchemy as sa
+from migrations import has_column
+
+# Versione delle impostazioni utente (chiave della cache delle liste pros / cons / coppie),
+# +1 ad ogni salvataggio di settings
+
+
+def upgrade(conn):
+    if not has_column(conn, 'user', 'settings_rev'):
+        conn.execute(sa.text('ALTER TABLE "user" ADD COLUMN settings_rev INTEGER DEFAULT 0'))
@@ -0,0 +1,78 @@
+import importlib
+import pkgutil
+import sqlalchemy as sa
+
+# Migrazioni versionate: migrations/NNNN_descrizione.py con upgrade(conn), eseguite in ordine,
+# ognuna nella sua transazione insieme all'aggiornamento della versione (tabella schema_version,
+# una riga). Un database vuoto non le esegue: schema dai modelli con create_all e versione = head.
+# Un database creato prima delle migrazioni (tabelle senza schema_version) parte da 0.
+# Gli script non importano app: descrivono lo schema com'era alla loro versione.
+
+metadata = sa.MetaData()
+schema_version = sa.Table('schema_version', metadata, sa.Column('version', sa.Integer, nullable=False))
+
+
+def scripts():
+    found = []
+    for info in pkgutil.iter_modules(__path__):
+        prefix = info.name.split('_', 1)[0]
+        if prefix.isdigit():
+            found.append((int(prefix), info.name))
+    return sorted(found)
+
+
+def head():
+    found = scripts()
+    return found[-1][0] if found else 0
+
+
+def current_version(conn):
+    # Una sola SELECT; None se la tabella non esiste
+    try:
+        return conn.execute(sa.select(schema_version.c.version)).scalar()
+    except sa.exc.DBAPIError:
+        conn.rollback()
+        return None
+
+
+def stamp(conn, version):
+    conn.execute(schema_version.delete())
+    conn.execute(schema_version.insert().values(version=version))
+
+
+def upgrade(engine, create_all, log=print):
+    # create_all(conn): crea lo schema attuale dei modelli. Ritorna la versione finale
+    with engine.connect() as conn:
+        version = current_version(conn)
+        if version is None:
+            legacy = sa.inspect(conn).has_table('user')
+            schema_version.create(conn)
+            if not legacy:
+                create_all(conn)
+                stamp(conn, head())
+                conn.commit()
+                log(f'Database nuovo: schema creato alla versione {head()}.')
+                return head()
+            stamp(conn, 0)
+            conn.commit()
+            version = 0
+        for number, name in scripts():
+            if number <= version:
+                continue
+            log(f'Migrazione {name}...')
+            importlib.import_module(f'{__name__}.{name}').upgrade(conn)
+            stamp(conn, number)
+            conn.commit()
+            version = number
+        return version
+
+
+# --- Helper per gli script (idempotenti: saltano ciò che esiste già) ---
+def has_column(conn, table, column):
+    return any(c['name'] == column for c in sa.inspect(conn).get_columns(table))
+
+
+def create_index(conn, table, name, *columns):
+    if not any(i['name'] == name for i in sa.inspect(conn).get_indexes(table)):
+        reflected = sa.Table(table, sa.MetaData(), autoload_with=conn)
+        sa.Index(name, *[reflected.c[c] for c in columns]).create(conn)
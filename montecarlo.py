@@ -0,0 +1,53 @@
+from functools import lru_cache
+import numpy as np
+
+# Simulazioni Monte Carlo vettorizzate: tutti i percorsi sono una matrice
+# (percorsi x passi), elaborata a blocchi per tenere bassa la memoria.
+
+DEFAULT_PATHS = 1000
+MAX_PATHS = 100_000
+DEFAULT_HORIZON = 100
+DEFAULT_SEED = 42
+CHUNK_PATHS = 10_000
+DD_THRESHOLDS = (10, 20, 100)
+
+
+@lru_cache(maxsize=64)
+def simulate_max_drawdowns(win_prob, avg_win, avg_loss, n_paths=DEFAULT_PATHS, horizon=DEFAULT_HORIZON, seed=DEFAULT_SEED):
+    # Ritorna i max drawdown dei percorsi, ordinati (per le probabilità di superamento)
+    rng = np.random.default_rng(seed)
+    out = np.empty(n_paths, dtype=np.float64)
+    for start in range(0, n_paths, CHUNK_PATHS):
+        size = min(CHUNK_PATHS, n_paths - start)
+        steps = np.where(rng.random((size, horizon)) < win_prob, avg_win, avg_loss)
+        equity = np.cumsum(steps, axis=1)
+        peak = np.maximum(np.maximum.accumulate(equity, axis=1), 0)
+        out[start:start + size] = (peak - equity).max(axis=1)
+    out.sort()
+    out.flags.writeable = False
+    return out
+
+
+def exceedance(sorted_dd, thresholds=DD_THRESHOLDS):
+    # % di percorsi con drawdown >= soglia
+    n = len(sorted_dd)
+    idx = np.searchsorted(sorted_dd, np.asarray(thresholds, dtype=np.float64), side='left')
+    return {str(t): round((n - int(i)) / n * 100, 1) for t, i in zip(thresholds, idx)}
+
+
+def risk_of_ruin(win_prob, avg_win, avg_loss, n_paths=DEFAULT_PATHS, horizon=DEFAULT_HORIZON,
+                 seed=DEFAULT_SEED, thresholds=DD_THRESHOLDS):
+    n_paths = max(1, min(int(n_paths), MAX_PATHS))
+    dd = simulate_max_drawdowns(float(win_prob), float(avg_win), float(avg_loss), n_paths, int(horizon), seed)
+    return exceedance(dd, thresholds)
+
+
+def bootstrap_curves(returns, n_curves=20, seed=DEFAULT_SEED, at=None):
+    # Curve di equity ricampionate con reinserimento dai rendimenti reali;
+    # at: indici da restituire (gli stessi punti della curva reale ridotta)
+    returns = np.asarray(returns, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    curves = np.cumsum(rng.choice(returns, size=(n_curves, len(returns))), axis=1)
+    if at is not None:
+        curves = curves[:, np.minimum(at, len(returns) - 1)]
+    return [[round(v, 2) for v in row] for row in curves.tolist()]
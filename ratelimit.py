@@ -0,0 +1,43 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+# Token bucket per chiave (IP, username...): ogni chiave ha al massimo `burst` gettoni e
+# ne recupera `per_minute` al minuto. Contatori per processo, con un numero massimo di
+# chiavi (le meno recenti vengono dimenticate, cioè ripartono dal bucket pieno).
+
+
+class TokenBucketLimiter:
+    def __init__(self, per_minute, burst, max_keys=100_000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self.lock = threading.Lock()
+        self.buckets = OrderedDict()   # chiave -> (gettoni, istante dell'ultimo aggiornamento)
+
+    @property
+    def enabled(self):
+        return self.rate > 0 and self.burst > 0
+
+    def _tokens(self, key, now):
+        tokens, last = self.buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - last) * self.rate)
+
+    def hit(self, *keys):
+        # Consuma un gettone da ogni chiave solo se tutte ne hanno uno.
+        # Ritorna (ammesso, secondi di attesa prima del prossimo tentativo utile)
+        if not self.enabled:
+            return True, 0
+        now = time.monotonic()
+        with self.lock:
+            tokens = {k: self._tokens(k, now) for k in keys}
+            short = [t for t in tokens.values() if t < 1]
+            if short:
+                return False, math.ceil((1 - min(short)) / self.rate)
+            for k, t in tokens.items():
+                self.buckets[k] = (t - 1, now)
+                self.buckets.move_to_end(k)
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+            return True, 0
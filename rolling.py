@@ -0,0 +1,166 @@
+import heapq
+from collections import deque
+
+# Analisi in streaming dei trade attivi in ordine di data: un solo passaggio, memoria costante
+# (finestre + punti campionati + primi K drawdown). Win rate ed expectancy su finestre mobili
+# di N trade, serie consecutive di vittorie / perdite, periodi sott'acqua dell'equity.
+# Le serie mobili sono campionate con passo che raddoppia quando il buffer è pieno: al più
+# max_points punti qualunque sia il numero di trade (più l'ultimo, sempre incluso).
+# Drawdown con picco che parte da 0 e durata dal giorno del picco al recupero, come equity.drawdown.
+
+DEFAULT_WINDOWS = (20, 50)
+DEFAULT_MAX_POINTS = 500
+TOP_DRAWDOWNS = 5
+LABEL_FORMAT = '%d/%m/%y'
+
+
+def label(d):
+    return d.strftime(LABEL_FORMAT) if d is not None else None
+
+
+class TradeStream:
+    def __init__(self, windows=DEFAULT_WINDOWS, max_points=DEFAULT_MAX_POINTS, top_drawdowns=TOP_DRAWDOWNS):
+        self.windows = tuple(windows)
+        self.max_points = max(2, max_points)
+        self.top_drawdowns = top_drawdowns
+        self.n = 0
+        self.first_date = None
+        self.last_date = None
+        # finestre mobili: (N, ultimi N trade, [vittorie, somma risultati]) aggiornate in O(1)
+        self.rolling = [(w, deque(maxlen=w), [0, 0.0]) for w in self.windows]
+        self.stride = 1
+        self.points = []   # (data, [(win rate, expectancy) o None per finestra])
+        # serie consecutive in corso: [lunghezza, inizio, P/L]; migliori: (trade, inizio, fine, P/L)
+        self.runs = {'win': [0, None, 0.0], 'loss': [0, None, 0.0]}
+        self.longest = {'win': None, 'loss': None}
+        # equity e periodi sott'acqua
+        self.equity = 0.0
+        self.peak = 0.0
+        self.peak_date = None
+        self.period = None   # periodo aperto
+        self.worst = []      # heap (profondità, sequenza, periodo) dei più profondi
+        self.periods = 0
+        self.longest_period = None
+        self.under_days = 0
+        self.under_trades = 0
+
+    def push(self, day, outcome, result):
+        result = result or 0.0
+        win = outcome == 'Target'
+        if self.first_date is None:
+            self.first_date = self.peak_date = day
+        self.last_date = day
+
+        for w, q, sums in self.rolling:
+            if len(q) == w:
+                old_win, old_result = q[0]   # esce dalla finestra con l'append
+                sums[0] -= old_win
+                sums[1] -= old_result
+            q.append((win, result))
+            sums[0] += win
+            sums[1] += result
+        if self.n % self.stride == 0:
+            self.points.append(self._point(day))
+            if len(self.points) > self.max_points:
+                del self.points[1::2]
+                self.stride *= 2
+        self.n += 1
+
+        if win or outcome == 'Stop Loss':
+            kind, other = ('win', 'loss') if win else ('loss', 'win')
+            run = self.runs[kind]
+            if not run[0]:
+                run[1], run[2] = day, 0.0
+            run[0] += 1
+            run[2] += result
+            self.runs[other][0] = 0
+            best = self.longest[kind]
+            if best is None or run[0] > best[0]:   # a parità resta la prima
+                self.longest[kind] = (run[0], run[1], day, run[2])
+        else:
+            self.runs['win'][0] = self.runs['loss'][0] = 0   # un Breakeven interrompe entrambe
+
+        self.equity += result
+        dd = self.peak - self.equity
+        if dd > 1e-9:
+            p = self.period
+            if p is None:
+                p = self.period = {'start': self.peak_date, 'trough': day, 'end': None, 'depth': 0.0, 'trades': 0}
+            p['trades'] += 1
+            self.under_trades += 1
+            if dd > p['depth']:
+                p['depth'], p['trough'] = dd, day
+        else:
+            if self.period is not None:
+                self.period['end'] = day
+                self._close(self.period)
+                self.period = None
+            if self.equity > self.peak:
+                self.peak = self.equity
+            self.peak_date = day
+
+    def _point(self, day):
+        return day, [(sums[0] / w * 100, sums[1] / w) if len(q) == w else None for w, q, sums in self.rolling]
+
+    def _close(self, p):
+        # periodo concluso (o aperto, a fine stream): durata, classifica per profondità
+        p['days'] = ((p['end'] or self.last_date) - p['start']).days
+        self.periods += 1
+        self.under_days += p['days']
+        if self.longest_period is None or p['days'] > self.longest_period['days']:
+            self.longest_period = p
+        item = (p['depth'], self.periods, p)
+        if len(self.worst) < self.top_drawdowns:
+            heapq.heappush(self.worst, item)
+        elif item[0] > self.worst[0][0]:
+            heapq.heapreplace(self.worst, item)
+
+    def result(self):
+        if self.period is not None:
+            self._close(self.period)   # il periodo aperto resta senza 'end'
+            self.period = None
+        points = list(self.points)
+        last = self._point(self.last_date) if self.n else None
+        if self.n and (self.n - 1) % self.stride:
+            points.append(last)
+        def series(i, digits):
+            return {str(w): [round(v[j][i], digits) if v[j] else None for _, v in points] for j, w in enumerate(self.windows)}
+        current = {str(w): {'win_rate': round(v[0], 2), 'expectancy': round(v[1], 3)} if v else None
+                   for w, v in zip(self.windows, last[1] if last else [None] * len(self.windows))}
+        run = next(({'kind': k, 'trades': r[0]} for k, r in self.runs.items() if r[0]), {'kind': None, 'trades': 0})
+        span = (self.last_date - self.first_date).days if self.n else 0
+        return {
+            'trades': self.n, 'points': len(points),
+            'rolling': {'windows': list(self.windows), 'labels': [label(d) for d, _ in points],
+                        'win_rate': series(0, 2), 'expectancy': series(1, 3), 'current': current},
+            'streaks': {'win': streak_dict(self.longest['win']), 'loss': streak_dict(self.longest['loss']), 'current': run},
+            'drawdowns': {
+                'worst': [period_dict(p) for _, _, p in sorted(self.worst, key=lambda item: (-item[0], item[1]))],
+                'periods': self.periods, 'longest': period_dict(self.longest_period),
+                'under_water_days': self.under_days,
+                'under_water_pct': round(self.under_days / span * 100, 1) if span else 0,
+                'under_water_trades_pct': round(self.under_trades / self.n * 100, 1) if self.n else 0,
+            },
+        }
+
+
+def streak_dict(best):
+    if best is None:
+        return None
+    trades, start, end, pl = best
+    return {'trades': trades, 'start': label(start), 'end': label(end), 'pl': round(pl, 2)}
+
+
+def period_dict(p):
+    if p is None:
+        return None
+    return {'start': label(p['start']), 'trough': label(p['trough']), 'end': label(p['end']),
+            'depth': round(p['depth'], 2), 'days': p['days'], 'trades': p['trades']}
+
+
+def analyze(rows, windows=DEFAULT_WINDOWS, max_points=DEFAULT_MAX_POINTS):
+    # rows: iterabile di (data, esito, risultato) in ordine di data
+    stream = TradeStream(windows, max_points)
+    for day, outcome, result in rows:
+        stream.push(day, outcome, result)
+    return stream.result()
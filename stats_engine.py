@@ -0,0 +1,97 @@
+from datetime import date
+from itertools import repeat
+from operator import itemgetter
+
+import numpy as np
+import equity
+
+# Motore statistico colonnare: i trade vengono caricati una sola volta in array
+# NumPy e ogni tabella diventa una riduzione raggruppata (bincount).
+# Timeframe / alignment / confluenze arrivano già raggruppati da trade_tag.
+
+FRAME_COLUMNS = ('date', 'outcome', 'result_percent', 'emotions')
+
+OUTCOME_CODES = {'Target': 0, 'Stop Loss': 1, 'Breakeven': 2}   # altro -> 3
+
+
+def make_stats_table(stats_dict):
+    table = []
+    for key, data in stats_dict.items():
+        wr = round(data['wins']/data['total']*100, 1) if data['total'] > 0 else 0
+        row_type = data.get('type', None)
+        table.append({'name': key, 'total': data['total'], 'win_rate': wr, 'result': round(data['pl'], 2), 'type': row_type})
+    table.sort(key=lambda x: x['result'], reverse=True)
+    return table
+
+
+# Unisce pro e contro; un contro con lo stesso nome di un pro diventa "Nome (Rischio)"
+def merge_confluences(pros, cons):
+    stats = dict(pros)
+    for name, data in cons.items():
+        key = name + " (Rischio)" if name in stats and stats[name]['type'] == 'Pro' else name
+        if key in stats:
+            for f in ('total', 'wins', 'pl'): stats[key][f] += data[f]
+        else:
+            stats[key] = data
+    return stats
+
+
+class TagIndex:
+    # Matrice di appartenenza trade x valore in forma sparsa (coppie riga/colonna).
+    # I nomi restano nell'ordine di prima apparizione, come nei dict originali.
+    def __init__(self, rows, cols, labels):
+        self.rows = rows
+        self.cols = cols
+        self.labels = labels
+
+    @classmethod
+    def single(cls, values, size):
+        # un valore per trade (riga i -> colonna del valore i-esimo)
+        names = {}
+        cols = np.fromiter((names.setdefault(v, len(names)) for v in values), dtype=np.int64, count=size)
+        return cls(np.arange(size, dtype=np.int64), cols, list(names))
+
+
+class TradeFrame:
+    def __init__(self, rows):
+        # un array per colonna, letto direttamente dalle tuple della query (nessuna trasposizione)
+        rows = rows if isinstance(rows, list) else list(rows)
+        date_col, outcome_col, result_col, emotion_col = (map(itemgetter(i), rows) for i in range(4))
+        self.size = len(rows)
+        self.date_ord = np.fromiter(map(date.toordinal, date_col), dtype=np.int64, count=self.size)
+        self.outcome = np.fromiter(map(OUTCOME_CODES.get, outcome_col, repeat(3)), dtype=np.int8, count=self.size)
+        result = np.array(list(result_col), dtype=np.float64)   # None -> nan
+        self.has_result = ~np.isnan(result)
+        self.result = np.where(self.has_result, result, 0.0)
+        self.active = self.outcome < 3
+        self.win = self.outcome == 0
+        self.emotions = TagIndex.single((e or "Non specificato" for e in emotion_col), self.size)
+
+    # --- RIDUZIONI ---
+    def _grouped(self, index):
+        mask = self.active[index.rows]
+        rows, cols = index.rows[mask], index.cols[mask]
+        k = len(index.labels)
+        total = np.bincount(cols, minlength=k)
+        wins = np.bincount(cols, weights=self.win[rows].astype(np.float64), minlength=k)
+        pl = np.bincount(cols, weights=self.result[rows], minlength=k)
+        # ordine di prima apparizione tra i soli trade attivi
+        first = np.full(k, len(index.rows), dtype=np.int64)
+        np.minimum.at(first, cols, np.flatnonzero(mask))
+        return np.argsort(first, kind='stable'), total, wins, pl
+
+    def emotion_stats(self):
+        order, total, wins, pl = self._grouped(self.emotions)
+        out = {}
+        for j in order:
+            if total[j]:
+                # "or 0": come sum() sui valori (result_percent or 0), zero resta intero
+                out[self.emotions.labels[j]] = {'total': int(total[j]), 'wins': int(wins[j]), 'pl': float(pl[j]) or 0}
+        return out
+
+    def active_returns(self):
+        return self.result[self.active]
+
+    def equity_curve(self, resolution='trade', max_points=equity.DEFAULT_MAX_POINTS):
+        mask = self.active & self.has_result
+        return equity.equity_curve(self.date_ord[mask], self.result[mask], resolution, max_points)
@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Database SQLite temporaneo: DATABASE_URL va impostato prima di importare app
+_tmpdir = tempfile.TemporaryDirectory(prefix='journal-test-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmpdir.name, 'test.db')}"
+os.environ.pop('DATABASE_READ_URL', None)
+os.environ.pop('CACHE_URL', None)
+os.environ['BCRYPT_LOG_ROUNDS'] = '4'
+os.environ['LOGIN_RATE_PER_MIN'] = '0'
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as journal  # noqa: E402
+
+PASSWORD = 'test'
+
+
+# Le richieste del test client girano fuori da questo contesto: ognuna ha il suo, come in produzione
+@pytest.fixture
+def app():
+    with journal.app.app_context():
+        journal.init_db(log=lambda *args: None)
+    yield journal
+    with journal.app.app_context():
+        for table in reversed(journal.db.metadata.sorted_tables):
+            journal.db.session.execute(table.delete())
+        journal.db.session.commit()
+    journal.result_cache.clear()
+    journal.cached_calendar.cache_clear()
+
+
+@pytest.fixture
+def app_ctx(app):
+    with app.app.app_context():
+        yield app
+
+
+@pytest.fixture
+def make_user(app):
+    def make(username, role='student'):
+        with app.app.app_context():
+            user = app.User(username=username, password=app.hash_password(PASSWORD), role=role)
+            app.db.session.add(user)
+            app.db.session.commit()
+            return user.id
+    return make
+
+
+@pytest.fixture
+def add_trade(app):
+    # Come la route add_trade: tag normalizzati e aggregati aggiornati nella stessa transazione
+    def add(user_id, **values):
+        with app.app.app_context():
+            trade = app.JournalEntry(user_id=user_id, **values)
+            app.set_trade_tags(trade)
+            app.db.session.add(trade)
+            app.update_trade_stats(trade)
+            app.db.session.commit()
+    return add
+
+
+@pytest.fixture
+def login(app):
+    def login(username):
+        client = app.app.test_client()
+        response = client.post('/login', data={'username': username, 'password': PASSWORD})
+        assert response.status_code == 302
+        return client
+    return login
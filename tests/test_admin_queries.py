@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Statement SQL per render delle viste admin: costanti, qualunque sia il numero di autori
+# e di trade (niente lookup N+1 dell'autore o del conteggio trade per utente).
+
+
+@pytest.fixture
+def count_statements():
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(Engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(Engine, 'before_cursor_execute', record)
+
+
+def seed(make_user, add_trade, students):
+    make_user('admin', role='admin')
+    for i in range(students):
+        user_id = make_user(f'studente{i}')
+        for j in range(4):
+            add_trade(user_id, date=date(2026, 1, 5) + timedelta(days=j), pair='EURUSD', direction='Long',
+                      outcome='Target', result_percent=1.0, rr_final=2.0)
+
+
+def render_count(client, statements, url):
+    client.get(url)   # primo render: riempie le cache per utente (liste dalle impostazioni)
+    statements.clear()
+    response = client.get(url)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('students', [2, 12])
+def test_admin_dashboard_offset(make_user, add_trade, login, count_statements, students):
+    seed(make_user, add_trade, students)
+    client = login('admin')
+    # principal, aggregato dei filtri, pagina con l'autore in JOIN
+    assert render_count(client, count_statements, '/dashboard?pagination=offset') == 3
+
+
+@pytest.mark.parametrize('students', [2, 12])
+def test_admin_dashboard_keyset(make_user, add_trade, login, count_statements, students):
+    seed(make_user, add_trade, students)
+    client = login('admin')
+    assert render_count(client, count_statements, '/dashboard?pagination=keyset') == 3
+
+
+@pytest.mark.parametrize('students', [2, 12])
+def test_admin_panel(make_user, add_trade, login, count_statements, students):
+    seed(make_user, add_trade, students)
+    client = login('admin')
+    # principal, utenti con conteggio trade in un'unica query aggregata
+    assert render_count(client, count_statements, '/admin_panel') == 2
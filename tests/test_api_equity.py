@@ -0,0 +1,15 @@
+from datetime import date, timedelta
+
+# /api/equity: il numero di punti è sempre limitato, anche con points=0 o negativo.
+
+
+def test_points_are_clamped(app, make_user, add_trade, login, monkeypatch):
+    monkeypatch.setattr(app, 'EQUITY_POINTS_LIMIT', 50)
+    user_id = make_user('studente')
+    for i in range(120):
+        add_trade(user_id, date=date(2025, 1, 1) + timedelta(days=i), pair='EURUSD', direction='Long',
+                  outcome='Target' if i % 3 else 'Stop Loss', result_percent=1.0 if i % 3 else -1.0)
+    client = login('studente')
+    for points, expected in ((0, 3), (-5, 3), (10, 10), (100000, 50)):
+        data = client.get(f'/api/equity?points={points}').get_json()['data']
+        assert len(data) <= expected, points
@@ -0,0 +1,24 @@
+import csv
+import io
+from datetime import date
+
+# export CSV: le celle testuali che inizierebbero una formula vengono prefissate con ', i numeri no.
+
+
+def test_csv_neutralizes_formulas(app, make_user, add_trade, login):
+    user_id = make_user('studente')
+    add_trade(user_id, date=date(2025, 1, 2), pair='EURUSD', direction='Long', outcome='Stop Loss',
+              result_percent=-1.5, notes='=HYPERLINK("http://x")', setup='@SUM(A1)', emotions='-ansia')
+    add_trade(user_id, date=date(2025, 1, 3), pair='GBPUSD', direction='Short', outcome='Target',
+              result_percent=2.0, notes='\tnota', setup='+1', emotions='calma')
+    client = login('studente')
+    body = client.get('/export?format=csv').get_data(as_text=True)
+    rows = {r['pair']: r for r in csv.DictReader(io.StringIO(body))}
+    assert rows['EURUSD']['notes'] == '\'=HYPERLINK("http://x")'
+    assert rows['EURUSD']['setup'] == "'@SUM(A1)"
+    assert rows['EURUSD']['emotions'] == "'-ansia"
+    assert rows['EURUSD']['result_percent'] == '-1.5'
+    assert rows['EURUSD']['date'] == '2025-01-02'
+    assert rows['GBPUSD']['notes'] == "'\tnota"
+    assert rows['GBPUSD']['setup'] == "'+1"
+    assert rows['GBPUSD']['emotions'] == 'calma'
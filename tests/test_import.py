@@ -0,0 +1,57 @@
+import io
+
+from sqlalchemy.exc import DBAPIError
+
+# Import CSV: righe non valide scartate una per una, mai un blocco intero, e conteggio
+# delle righe importate sempre disponibile.
+
+HEADER = 'date,pair,direction,outcome,result_percent,emotions'
+
+
+def csv_rows(n, start=0):
+    return [f'2026-01-{1 + i % 28:02d},EURUSD,buy,Target,1,Calmo' for i in range(start, start + n)]
+
+
+def run_import(app, user_id, lines, batch_size=5):
+    with app.app.app_context():
+        return app.import_trades_csv(io.StringIO('\n'.join([HEADER] + lines)), user_id, batch_size)
+
+
+def count_trades(app, user_id):
+    with app.app.app_context():
+        return app.JournalEntry.query.filter_by(user_id=user_id).count()
+
+
+def test_overlong_values_are_row_errors(app, make_user):
+    user_id = make_user('studente')
+    lines = csv_rows(3) + ['2026-01-05,EURUSD,buy,Target,1,' + 'x' * 51, '2026-01-05,' + 'P' * 21 + ',buy,Target,1,'] + csv_rows(2)
+    imported, errors = run_import(app, user_id, lines)
+    assert imported == 5 and count_trades(app, user_id) == 5
+    assert errors == [(5, 'emotions troppo lungo (max 50 caratteri)'), (6, 'pair troppo lungo (max 20 caratteri)')]
+
+
+def test_rejected_batch_falls_back_to_rows(app, make_user, monkeypatch):
+    # il database rifiuta un blocco per una sola riga: le altre del blocco vengono importate
+    user_id = make_user('studente')
+    original = app.insert_trade_batch
+    def insert(uid, rows):
+        if any(r['pair'] == 'RIFIUTATA' for r in rows):
+            raise DBAPIError('INSERT', {}, Exception('value too long'))
+        return original(uid, rows)
+    monkeypatch.setattr(app, 'insert_trade_batch', insert)
+    lines = csv_rows(6) + ['2026-01-09,rifiutata,buy,Target,1,'] + csv_rows(3, 6)
+    imported, errors = run_import(app, user_id, lines)
+    assert imported == 9 and count_trades(app, user_id) == 9
+    assert errors == [(8, 'rifiutata dal database (Exception)')]
+    with app.app.app_context():
+        assert app.load_trade_stats(user_id)['all']['n'] == 9
+
+
+def test_unreadable_file_keeps_count(app, make_user):
+    # byte non UTF-8 dopo i primi blocchi: la lettura si ferma, i trade già scritti sono contati
+    user_id = make_user('studente')
+    data = '\n'.join([HEADER] + csv_rows(400)).encode() + b'\n2026-01-05,EUR\xffUSD,buy,Target,1,\n'
+    with app.app.app_context():
+        imported, errors = app.import_trades_csv(io.TextIOWrapper(io.BytesIO(data), encoding='utf-8'), user_id, 50)
+    assert imported == count_trades(app, user_id) > 0
+    assert errors and errors[-1][1].startswith('lettura interrotta')
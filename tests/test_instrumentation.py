@@ -0,0 +1,37 @@
+import cProfile
+
+import pytest
+
+import instrumentation
+
+# Profiling delle richieste lente con worker a thread: un solo cProfile attivo per processo.
+
+
+@pytest.fixture
+def profiling(app, tmp_path):
+    app.app.config.update(PROFILE_SLOW_MS=0, PROFILE_DIR=str(tmp_path))
+    yield tmp_path
+    app.app.config['PROFILE_SLOW_MS'] = None
+
+
+def test_slow_request_is_profiled(app, profiling):
+    assert app.app.test_client().get('/login').status_code == 200
+    assert len(list(profiling.iterdir())) == 1
+    assert not instrumentation.profiler_lock.locked()
+
+
+def test_concurrent_request_skips_profiling(app, profiling):
+    # un'altra richiesta sta già profilando: questa risponde normalmente, senza profilo
+    with instrumentation.profiler_lock:
+        assert app.app.test_client().get('/login').status_code == 200
+    assert list(profiling.iterdir()) == []
+
+
+def test_profiler_already_active(app, profiling, monkeypatch):
+    # Python 3.12+: enable() con un altro profiler attivo solleva ValueError
+    def busy(self):
+        raise ValueError('Another profiling tool is already active')
+    monkeypatch.setattr(cProfile.Profile, 'enable', busy)
+    assert app.app.test_client().get('/login').status_code == 200
+    assert list(profiling.iterdir()) == []
+    assert not instrumentation.profiler_lock.locked()
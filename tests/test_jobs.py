@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+# Job in background: pool di processi avviato con forkserver / spawn e stato "failed"
+# registrato anche quando il figlio muore prima che run_job possa scriverlo.
+
+
+def wait_job(client, url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        info = client.get(url).get_json()
+        if info['status'] in ('done', 'failed'):
+            return info
+        time.sleep(0.2)
+    raise AssertionError(f'job non concluso: {info}')
+
+
+def test_job_runs_in_pool(app, make_user, login):
+    make_user('studente')
+    client = login('studente')
+    response = client.post('/jobs', data={'kind': 'montecarlo', 'mc_paths': 100})
+    assert response.status_code == 202
+    info = wait_job(client, response.get_json()['url'])
+    assert info['status'] == 'done', info
+    assert app.job_executor._mp_context.get_start_method() == app.JOB_START_METHOD != 'fork'
+
+
+def test_dead_worker_marks_job_failed(app, make_user):
+    user_id = make_user('studente')
+    with app.app.app_context():
+        job = app.AnalyticsJob(id='morto', user_id=user_id, kind='montecarlo', status='running', params='{}')
+        app.db.session.add(job)
+        app.db.session.commit()
+    future = Future()
+    future.set_exception(BrokenProcessPool('figlio terminato'))
+    app.job_done('morto', future)
+    with app.app.app_context():
+        job = app.db.session.get(app.AnalyticsJob, 'morto')
+        assert job.status == 'failed' and job.finished_at is not None
+        assert job.error == 'BrokenProcessPool: figlio terminato'
+
+
+def test_finished_job_is_not_overwritten(app, make_user):
+    user_id = make_user('studente')
+    with app.app.app_context():
+        app.db.session.add(app.AnalyticsJob(id='finito', user_id=user_id, kind='montecarlo', status='done', params='{}'))
+        app.db.session.commit()
+    future = Future()
+    future.set_result(None)
+    app.job_done('finito', future)
+    with app.app.app_context():
+        assert app.db.session.get(app.AnalyticsJob, 'finito').status == 'done'
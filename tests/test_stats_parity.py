@@ -0,0 +1,114 @@
+from datetime import date
+
+# Tabelle della pagina statistiche (make_stats_table su tag normalizzati e TradeFrame)
+# confrontate con il calcolo originale di statistics_page, riga per riga e nello stesso ordine.
+# Unica differenza voluta: un timeframe / alignment vuoto ("H1,") non diventa un tag in
+# trade_tag, quindi manca la riga senza nome che il calcolo originale mostrava.
+
+TRADES = [
+    # data, esito, risultato, rr, timeframe, alignment, pro, contro, emozione
+    (date(2026, 1, 5), 'Target', 2.0, 2.5, 'H1,M15', 'H4', 'Trendline,Supporto', 'News in arrivo', 'Calmo'),
+    (date(2026, 1, 5), 'Stop Loss', -1.0, None, 'H1', 'H4,D1', 'Trendline', 'Trendline', ''),
+    (date(2026, 1, 6), 'Breakeven', None, None, 'M15,M15', '', 'Supporto,,Supporto', '', None),
+    (date(2026, 1, 7), 'Non eseguito', 3.0, 1.0, 'H1', 'H4', 'Trendline', 'News in arrivo', 'Ansia'),
+    (date(2026, 1, 8), 'Target', None, 3.0, ' M5 ', 'D1', ' Rottura Struttura ', 'Contro Trend,Trendline', 'Calmo'),
+    (date(2026, 1, 12), 'Stop Loss', -1.5, 0.0, None, None, None, None, 'Ansia'),
+    (date(2026, 2, 2), 'Target', 1.5, 1.5, 'H1,M5,', 'H4', 'Rottura Struttura', 'Contro Trend', 'Fomo'),
+    (date(2026, 2, 3), 'Stop Loss', -1.0, None, 'M15', 'D1,H4', 'Supporto,Trendline', 'Trendline,Trendline', 'Calmo'),
+    (date(2026, 2, 3), 'Target', 1.0, 2.0, 'H1', 'H4', '', 'News in arrivo', None),
+    (date(2026, 2, 4), None, None, None, 'H1', 'H4', 'Trendline', None, 'Fomo'),
+]
+
+
+def make_stats_table(stats_dict):
+    table = []
+    for key, data in stats_dict.items():
+        wr = round(data['wins']/data['total']*100, 1) if data['total'] > 0 else 0
+        row_type = data.get('type', None)
+        table.append({'name': key, 'total': data['total'], 'win_rate': wr, 'result': round(data['pl'], 2), 'type': row_type})
+    table.sort(key=lambda x: x['result'], reverse=True)
+    return table
+
+
+def named_rows(table):
+    return [row for row in table if row['name']]
+
+
+def split_stats(active_trades, column):
+    out = {}
+    for t in active_trades:
+        if getattr(t, column):
+            for v in getattr(t, column).split(','):
+                v = v.strip()
+                if v not in out: out[v] = {'total': 0, 'wins': 0, 'pl': 0}
+                out[v]['total'] += 1
+                out[v]['pl'] += (t.result_percent or 0)
+                if t.outcome == 'Target': out[v]['wins'] += 1
+    return out
+
+
+def baseline_tables(trades):
+    # Logica di statistics_page prima del motore colonnare
+    active_trades = [t for t in trades if t.outcome in ['Target', 'Stop Loss', 'Breakeven']]
+    confluences_stats = {}
+    for t in active_trades:
+        if t.selected_pros:
+            for p in t.selected_pros.split(','):
+                p = p.strip()
+                if not p: continue
+                if p not in confluences_stats: confluences_stats[p] = {'total': 0, 'wins': 0, 'pl': 0, 'type': 'Pro'}
+                confluences_stats[p]['total'] += 1
+                confluences_stats[p]['pl'] += (t.result_percent or 0)
+                if t.outcome == 'Target': confluences_stats[p]['wins'] += 1
+    for t in active_trades:
+        if t.selected_cons:
+            for c in t.selected_cons.split(','):
+                c = c.strip()
+                if not c: continue
+                key = c
+                if key in confluences_stats and confluences_stats[key]['type'] == 'Pro':
+                    key = c + " (Rischio)"
+                if key not in confluences_stats: confluences_stats[key] = {'total': 0, 'wins': 0, 'pl': 0, 'type': 'Contro'}
+                confluences_stats[key]['total'] += 1
+                confluences_stats[key]['pl'] += (t.result_percent or 0)
+                if t.outcome == 'Target': confluences_stats[key]['wins'] += 1
+    emotions_stats = {}
+    for t in active_trades:
+        emo = t.emotions if t.emotions else "Non specificato"
+        if emo not in emotions_stats: emotions_stats[emo] = {'total': 0, 'wins': 0, 'pl': 0}
+        emotions_stats[emo]['total'] += 1
+        emotions_stats[emo]['pl'] += (t.result_percent or 0)
+        if t.outcome == 'Target': emotions_stats[emo]['wins'] += 1
+    return {
+        'tf_table': make_stats_table(split_stats(active_trades, 'timeframe')),
+        'align_table': make_stats_table(split_stats(active_trades, 'alignment')),
+        'confluences_table': make_stats_table(confluences_stats),
+        'emotions_table': make_stats_table(emotions_stats),
+    }
+
+
+def seed(make_user, add_trade, username='studente'):
+    user_id = make_user(username)
+    for d, outcome, result, rr, tf, align, pros, cons, emo in TRADES:
+        add_trade(user_id, date=d, pair='EURUSD', direction='Long', outcome=outcome, result_percent=result,
+                  rr_final=rr, timeframe=tf, alignment=align, selected_pros=pros, selected_cons=cons, emotions=emo)
+    return user_id
+
+
+def test_tables_match_baseline(app_ctx, make_user, add_trade):
+    app = app_ctx
+    user_id = seed(make_user, add_trade)
+    payload = app.statistics_payload(user_id, app.load_trade_stats(user_id), '2026-01', 100)
+    trades = app.JournalEntry.query.filter_by(user_id=user_id).order_by(app.JournalEntry.date.asc()).all()
+    for name, table in baseline_tables(trades).items():
+        assert payload[name] == named_rows(table), name
+
+
+def test_admin_tables_match_baseline(app_ctx, make_user, add_trade):
+    app = app_ctx
+    seed(make_user, add_trade, 'primo')
+    seed(make_user, add_trade, 'secondo')
+    payload = app.statistics_payload(None, app.load_trade_stats(None), '2026-02', 100)
+    trades = app.JournalEntry.query.order_by(app.JournalEntry.date.asc()).all()
+    for name, table in baseline_tables(trades).items():
+        assert payload[name] == named_rows(table), name
@@ -0,0 +1,113 @@
+from datetime import date
+
+import pytest
+
+# Aggregati incrementali (trade_stat) mantenuti da add / edit / delete e dall'import CSV:
+# devono coincidere con una ricostruzione completa da journal_entry.
+
+
+def trade_form(date='2026-01-05', outcome='Target', result='1', rr='2', **extra):
+    return dict({'date': date, 'pair': 'EURUSD', 'direction': 'Long', 'outcome': outcome,
+                 'result_percent': result, 'rr_final': rr}, **extra)
+
+
+def stats_without_rev(app, user_id):
+    with app.app.app_context():
+        return {b: {f: v for f, v in row.items() if f != 'rev'} for b, row in app.load_trade_stats(user_id).items()}
+
+
+def rebuilt(app, user_id):
+    with app.app.app_context():
+        app.rebuild_trade_stats(user_id)
+    return stats_without_rev(app, user_id)
+
+
+def assert_matches_rebuild(app, user_id):
+    incremental = stats_without_rev(app, user_id)
+    expected = rebuilt(app, user_id)
+    # le righe svuotate dalle cancellazioni restano con conteggi a zero
+    assert {b: r for b, r in incremental.items() if r['n']} == {b: pytest.approx(r) for b, r in expected.items() if r['n']}
+
+
+def trade_ids(app, user_id):
+    with app.app.app_context():
+        return [t.id for t in app.JournalEntry.query.filter_by(user_id=user_id).order_by(app.JournalEntry.id)]
+
+
+def test_add_edit_delete_match_rebuild(app, make_user, login):
+    user_id = make_user('studente')
+    client = login('studente')
+    for form in (trade_form(), trade_form('2026-01-06', 'Stop Loss', '-1.3', '0'),
+                 trade_form('2026-02-02', 'Breakeven', '0', '0', direction='Short'),
+                 trade_form('2026-02-03', 'Target', '2.7', '3', timeframe_barrier='H1'),
+                 trade_form('2026-02-10', 'Non eseguito', '0.4', '1')):
+        client.post('/add_trade', data=form)
+    ids = trade_ids(app, user_id)
+    assert len(ids) == 5
+    assert_matches_rebuild(app, user_id)
+
+    # modifica che cambia mese, giorno, direzione ed esito: via dai vecchi bucket, dentro i nuovi
+    client.post(f'/edit_trade/{ids[1]}', data=trade_form('2026-03-04', 'Target', '1.1', '2.2', direction='Short'))
+    client.post(f'/edit_trade/{ids[2]}', data=trade_form('2026-02-02', 'Stop Loss', '-0.7', '0'))
+    assert_matches_rebuild(app, user_id)
+
+    client.get(f'/delete_trade/{ids[0]}')
+    client.get(f'/delete_trade/{ids[3]}')
+    assert_matches_rebuild(app, user_id)
+
+
+def test_import_matches_rebuild(app, make_user):
+    user_id = make_user('studente')
+    rows = ['date,pair,direction,outcome,result_percent,rr_final'] + [
+        f"2026-0{1 + i % 3}-{1 + i % 27:02d},EURUSD,{'buy' if i % 2 else 'sell'},"
+        f"{('Target', 'Stop Loss', 'Breakeven')[i % 3]},{(i % 7) * 0.3 - 0.9:.1f},{i % 4}" for i in range(40)]
+    with app.app.app_context():
+        import io
+        imported, errors = app.import_trades_csv(io.StringIO('\n'.join(rows)), user_id, batch_size=7)
+    assert (imported, errors) == (40, [])
+    assert_matches_rebuild(app, user_id)
+
+
+def test_deleted_losses_leave_no_float_residue(app, make_user, login):
+    # 6 Target e 2 Stop Loss a -0.1 e -0.2, poi via gli SL: loss_pl non deve restare -2.8e-17
+    user_id = make_user('studente')
+    client = login('studente')
+    for i in range(6):
+        client.post('/add_trade', data=trade_form(f'2026-01-{5 + i:02d}', 'Target', '1', '2'))
+    for result in ('-0.1', '-0.2'):
+        client.post('/add_trade', data=trade_form('2026-01-12', 'Stop Loss', result, '0'))
+    for trade_id in trade_ids(app, user_id)[6:]:
+        client.get(f'/delete_trade/{trade_id}')
+
+    with app.app.app_context():
+        tot = app.load_trade_stats(user_id)['all']
+    assert tot['losses'] == 0 and tot['loss_pl'] == 0
+    payload = client.get('/api/statistics').get_json()
+    assert payload['num_losses'] == 0
+    assert payload['profit_factor'] == 6.0
+    assert payload['sharpe_ratio'] == 0
+
+
+def test_upsert_new_bucket(app, make_user):
+    # la prima scrittura crea la riga, la seconda somma (ON CONFLICT DO UPDATE) senza IntegrityError
+    user_id = make_user('studente')
+    delta = {f: 1 for f in ('n', 'active', 'wins')}
+    with app.app.app_context():
+        full = dict.fromkeys(app.TRADE_STAT_FIELDS, 0)
+        app.apply_trade_stat_deltas(user_id, {'m:2026-01': dict(full, **delta)})
+        app.apply_trade_stat_deltas(user_id, {'m:2026-01': dict(full, **delta)})
+        app.db.session.commit()
+        row = app.load_trade_stats(user_id)['m:2026-01']
+    assert (row['n'], row['wins'], row['rev']) == (2, 2, 2)
+
+
+def test_rebuild_keeps_rev_increasing(app, make_user, add_trade):
+    # rev entra nelle chiavi di cache / ETag: una ricostruzione non deve riportarlo indietro
+    user_id = make_user('studente')
+    for day in (5, 6, 7):
+        add_trade(user_id, date=date(2026, 1, day), pair='EURUSD', direction='Long', outcome='Target', result_percent=1.0)
+    with app.app.app_context():
+        before = app.load_trade_stats(user_id)['all']['rev']
+        app.rebuild_trade_stats(user_id)
+        after = app.load_trade_stats(user_id)['all']
+    assert before == 3 and after['rev'] > before and after['n'] == 3